@@ -0,0 +1,359 @@
+#!/usr/bin/env python3
+
+'''
+   This module holds the Renewal Audit Trail. Each run, and each certificate
+   renewed within it (stage timings, portal response codes, CSR fingerprint
+   and outcome), is appended as a JSON record to the Audit Store.
+
+   Run as a program, the module renders the store,
+   ***********************************************************************
+   * report -> Summary: throughput, slowest stages, failure breakdown    *
+   *           by portal step. Formats: json / csv / html.               *
+   * export -> One row per certificate record. Formats: json / csv.      *
+   ***********************************************************************
+   Both read the store one record at a time, whatever its size.
+'''
+
+##################################################################
+# Module Import Section.
+# Make all the necessary imports within this section.
+# Don't Pollute the entire file, with imports here and there.
+##################################################################
+
+# Used for parsing the command line options.
+import argparse
+# Used for fingerprinting the CSR.
+import base64, binascii, hashlib
+# Used for keeping the *N* slowest stages only.
+import heapq
+# Used for rendering the HTML report.
+import html
+# The store and the reports are JSON / CSV.
+import csv, json
+# To help out with OS level interactions.
+import os
+# Used for serializing the appends made from different threads.
+import threading
+# The below import deals with system user information.
+import getpass
+# The below library utility provides the system's information.
+import platform
+# The below import is a time manipulation utility library.
+import time
+# Used for generating the Run identifiers.
+import uuid
+# Used for the report output stream.
+import sys
+
+import config.AuditConfig
+
+##################################################################
+
+class AuditStore(object):
+	'''
+	   The append-only store. One JSON record per line, each append is
+	   a single (flushed) write, so a crash never leaves a run half
+	   recorded in the middle of the file.
+	'''
+
+	def __init__(self, store_file_name=None):
+		self.store_file_name = store_file_name or config.AuditConfig.AUDIT_STORE_FILENAME
+		self.lock            = threading.Lock()
+
+	def append(self, record):
+		record_line = json.dumps(record, sort_keys=True) + '\n'
+		with self.lock:
+			store_directory = os.path.dirname(self.store_file_name)
+			if store_directory and not os.path.exists(store_directory):
+				os.makedirs(store_directory)
+			with open(self.store_file_name, 'a') as store_file_obj:
+				store_file_obj.write(record_line)
+				store_file_obj.flush()
+				os.fsync(store_file_obj.fileno())
+
+	def records(self, record_type=None):
+		'''
+		   Generator yielding the stored records, one at a time.
+		   Lines which fail to parse (i.e, a torn last line) are skipped.
+		'''
+		if not os.path.isfile(self.store_file_name):
+			return
+		with open(self.store_file_name, 'r') as store_file_obj:
+			for record_line in store_file_obj:
+				try:
+					record = json.loads(record_line)
+				except ValueError:
+					continue
+				if record_type is None or record.get('type') == record_type:
+					yield record
+
+def csr_fingerprint(csr_content):
+	'''
+	   SHA-256 fingerprint of the CSR (DER encoding, when the PEM decodes).
+	'''
+	pem_body = ''.join(line for line in csr_content.splitlines() if line and not line.startswith('-----'))
+	try:
+		csr_bytes = base64.b64decode(pem_body.encode('ascii'), validate=True)
+	except (ValueError, binascii.Error):
+		csr_bytes = csr_content.encode('utf-8')
+	return 'sha256:' + hashlib.sha256(csr_bytes).hexdigest()
+
+class RenewalRun(object):
+	'''
+	   A single run of the renewal utility. Captures the environment
+	   information once, and records the run itself when finished.
+	   With a *stage_profiler* (StageProfiler), the stages are profiled
+	   as well.
+	'''
+
+	def __init__(self, audit_store=None, stage_profiler=None):
+		self.audit_store  = audit_store or AuditStore()
+		self.run_id       = uuid.uuid4().hex
+		self.started      = time.time()
+		self.user         = getpass.getuser()
+		self.host         = platform.node()
+		self.os_info      = platform.system()
+		self.certificates = 0
+		self.failures     = 0
+		# Certificates of the run may finish concurrently.
+		self.lock         = threading.Lock()
+		# `None` unless the run is profiled.
+		self.stage_profiler = stage_profiler
+
+	def certificate(self, app_name):
+		'''
+		   Start auditing a certificate of this run.
+		'''
+		return CertificateAudit(self, app_name)
+
+	def finish(self, outcome=config.AuditConfig.RUN_OUTCOME_COMPLETED, pre_flight_failures=None):
+		'''
+		   Append the run record. A batch rejected by the Pre-Flight check
+		   is recorded with the *pre_flight_failures* (`(app_name, problems)`
+		   tuples) that aborted it.
+		'''
+		self.audit_store.append({
+								 'type'        : 'run',
+								 'outcome'     : outcome,
+								 'run_id'      : self.run_id,
+								 'started'     : self.started,
+								 'finished'    : time.time(),
+								 'user'        : self.user,
+								 'host'        : self.host,
+								 'os_info'     : self.os_info,
+								 'certificates': self.certificates,
+								 'failures'    : self.failures,
+								 'pre_flight_failures': [[app_name, problems] for app_name, problems in pre_flight_failures or ()],
+								})
+
+class CertificateAudit(object):
+	'''
+	   Collect the stage timings and response codes of one certificate,
+	   appended to the store as a single record by `finish()`.
+	'''
+
+	__slots__ = ('renewal_run', 'app_name', 'started', 'stage_timings',
+				 'response_codes', 'csr_fingerprint', 'current_stage',)
+
+	def __init__(self, renewal_run, app_name):
+		self.renewal_run     = renewal_run
+		self.app_name        = app_name
+		self.started         = time.time()
+		self.stage_timings   = {}
+		self.response_codes  = {}
+		self.csr_fingerprint = None
+		self.current_stage   = None
+
+	def stage(self, stage_name):
+		'''
+		   Time the stage run within the `with` block.
+		'''
+		return _StageTimer(self, stage_name)
+
+	def record_response(self, stage_name, response_code):
+		self.response_codes[stage_name] = response_code
+
+	def record_csr(self, csr_content):
+		self.csr_fingerprint = csr_fingerprint(csr_content)
+
+	def finish(self, succeeded):
+		'''
+		   Append the certificate record. On failure, the stage running
+		   (or last run) at that point is recorded as the failed stage.
+		'''
+		with self.renewal_run.lock:
+			self.renewal_run.certificates += 1
+			if not succeeded:
+				self.renewal_run.failures += 1
+		self.renewal_run.audit_store.append({
+			'type'           : 'certificate',
+			'run_id'         : self.renewal_run.run_id,
+			'app_name'       : self.app_name,
+			'started'        : self.started,
+			'finished'       : time.time(),
+			'stage_timings'  : self.stage_timings,
+			'response_codes' : self.response_codes,
+			'csr_fingerprint': self.csr_fingerprint,
+			'outcome'        : config.AuditConfig.OUTCOME_SUCCESS if succeeded else config.AuditConfig.OUTCOME_FAILURE,
+			'failed_stage'   : None if succeeded else self.current_stage,
+		})
+
+class _StageTimer(object):
+
+	__slots__ = ('certificate_audit', 'stage_name', 'started',)
+
+	def __init__(self, certificate_audit, stage_name):
+		self.certificate_audit = certificate_audit
+		self.stage_name        = stage_name
+
+	def __enter__(self):
+		self.certificate_audit.current_stage = self.stage_name
+		stage_profiler = self.certificate_audit.renewal_run.stage_profiler
+		if stage_profiler is not None:
+			# The frame holding the `with` block.
+			stage_profiler.enter_stage(self.stage_name, sys._getframe(1))
+		self.started = time.perf_counter()
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		self.certificate_audit.stage_timings[self.stage_name] = round(time.perf_counter() - self.started, 6)
+		stage_profiler = self.certificate_audit.renewal_run.stage_profiler
+		if stage_profiler is not None:
+			stage_profiler.exit_stage()
+		return False
+
+#****************************** REPORTING *******************************
+
+def summarize(audit_store, top_n=config.AuditConfig.REPORT_TOP_N):
+	'''
+	   Aggregate the whole store in a single pass. Only the running totals
+	   and the *top_n* slowest stages are held in memory.
+	'''
+	run_count        = 0
+	run_outcomes     = {}
+	run_seconds      = 0.0
+	certificates     = 0
+	outcomes         = {}
+	failed_stages    = {}
+	stage_totals     = {}
+	slowest_stages   = []
+	for record in audit_store.records():
+		if record.get('type') == 'run':
+			run_count   += 1
+			# Runs recorded before run outcomes existed all completed.
+			run_outcome  = record.get('outcome', config.AuditConfig.RUN_OUTCOME_COMPLETED)
+			run_outcomes[run_outcome] = run_outcomes.get(run_outcome, 0) + 1
+			run_seconds += max(record['finished'] - record['started'], 0.0)
+			continue
+		certificates += 1
+		outcomes[record['outcome']] = outcomes.get(record['outcome'], 0) + 1
+		if record.get('failed_stage'):
+			failed_stages[record['failed_stage']] = failed_stages.get(record['failed_stage'], 0) + 1
+		for stage_name, seconds in record['stage_timings'].items():
+			count, total, slowest = stage_totals.get(stage_name, (0, 0.0, 0.0))
+			stage_totals[stage_name] = (count + 1, total + seconds, max(slowest, seconds))
+			slowest_entry = (seconds, stage_name, record['app_name'], record['run_id'])
+			if len(slowest_stages) < top_n:
+				heapq.heappush(slowest_stages, slowest_entry)
+			elif slowest_entry > slowest_stages[0]:
+				heapq.heapreplace(slowest_stages, slowest_entry)
+
+	# Known stages first (in run order), then whatever else was recorded.
+	stage_order = [stage for stage in config.AuditConfig.STAGES if stage in stage_totals] + \
+				  sorted(stage for stage in stage_totals if stage not in config.AuditConfig.STAGES)
+	return {
+			'runs'                   : run_count,
+			'run_outcomes'           : run_outcomes,
+			'certificates'           : certificates,
+			'outcomes'               : outcomes,
+			'throughput_per_minute'  : round(certificates * 60.0 / run_seconds, 3) if run_seconds else None,
+			'stages'                 : [{'stage'          : stage,
+										 'count'          : stage_totals[stage][0],
+										 'average_seconds': round(stage_totals[stage][1] / stage_totals[stage][0], 6),
+										 'max_seconds'    : stage_totals[stage][2],
+										 'total_seconds'  : round(stage_totals[stage][1], 6),}
+										for stage in stage_order],
+			'slowest_stages'         : [{'seconds': seconds, 'stage': stage_name, 'app_name': app_name, 'run_id': run_id}
+										for seconds, stage_name, app_name, run_id in sorted(slowest_stages, reverse=True)],
+			'failures_by_stage'      : failed_stages,
+		   }
+
+def _summary_rows(summary):
+	'''
+	   Flatten the summary into `(section, key, value)` rows.
+	'''
+	yield ('overview', 'runs', summary['runs'])
+	yield ('overview', 'certificates', summary['certificates'])
+	yield ('overview', 'throughput_per_minute', summary['throughput_per_minute'])
+	for run_outcome, count in sorted(summary['run_outcomes'].items()):
+		yield ('run_outcomes', run_outcome, count)
+	for outcome, count in sorted(summary['outcomes'].items()):
+		yield ('outcomes', outcome, count)
+	for stage in summary['stages']:
+		for key in ('count', 'average_seconds', 'max_seconds', 'total_seconds'):
+			yield ('stage:' + stage['stage'], key, stage[key])
+	for slowest in summary['slowest_stages']:
+		yield ('slowest_stages', '{} [{}] run={}'.format(slowest['app_name'], slowest['stage'], slowest['run_id']), slowest['seconds'])
+	for stage_name, count in sorted(summary['failures_by_stage'].items()):
+		yield ('failures_by_stage', stage_name, count)
+
+def render_report(summary, report_format, output_stream):
+	if report_format == 'json':
+		json.dump(summary, output_stream, indent=2, sort_keys=True)
+		output_stream.write('\n')
+	elif report_format == 'csv':
+		csv_writer = csv.writer(output_stream)
+		csv_writer.writerow(('section', 'key', 'value'))
+		csv_writer.writerows(_summary_rows(summary))
+	else:
+		output_stream.write('<!DOCTYPE html>\n<html><head><meta charset="utf-8"><title>Certificate Renewal Report</title></head><body>\n')
+		output_stream.write('<h1>Certificate Renewal Report</h1>\n')
+		current_section = None
+		for section, key, value in _summary_rows(summary):
+			if section != current_section:
+				if current_section is not None:
+					output_stream.write('</table>\n')
+				output_stream.write('<h2>{}</h2>\n<table border="1">\n'.format(html.escape(section)))
+				current_section = section
+			output_stream.write('<tr><td>{}</td><td>{}</td></tr>\n'.format(html.escape(str(key)), html.escape(str(value))))
+		if current_section is not None:
+			output_stream.write('</table>\n')
+		output_stream.write('</body></html>\n')
+
+def export_certificates(audit_store, export_format, output_stream):
+	'''
+	   Stream one row per certificate record, with a column per stage.
+	'''
+	if export_format == 'json':
+		for record in audit_store.records('certificate'):
+			output_stream.write(json.dumps(record, sort_keys=True) + '\n')
+		return
+	csv_writer = csv.writer(output_stream)
+	csv_writer.writerow(['run_id', 'app_name', 'started', 'outcome', 'failed_stage', 'csr_fingerprint'] +
+						[stage + '_seconds' for stage in config.AuditConfig.STAGES] +
+						[stage + '_response' for stage in config.AuditConfig.STAGES[1:]])
+	for record in audit_store.records('certificate'):
+		csv_writer.writerow([record['run_id'], record['app_name'],
+							 time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(record['started'])),
+							 record['outcome'], record['failed_stage'] or '', record['csr_fingerprint'] or ''] +
+							[record['stage_timings'].get(stage, '') for stage in config.AuditConfig.STAGES] +
+							[record['response_codes'].get(stage, '') for stage in config.AuditConfig.STAGES[1:]])
+
+#****************************** REPORTING *******************************
+
+# Execute Module Code.
+if __name__ == '__main__':
+	arg_parser = argparse.ArgumentParser(description='Certificate Renewal Audit Reports.')
+	arg_parser.add_argument('command', choices=('report', 'export'))
+	arg_parser.add_argument('--format', dest='output_format', choices=config.AuditConfig.REPORT_FORMATS, default='json')
+	arg_parser.add_argument('--store', default=config.AuditConfig.AUDIT_STORE_FILENAME, help='The Audit Store to read.')
+	arg_parser.add_argument('--top', type=int, default=config.AuditConfig.REPORT_TOP_N, help='Number of slowest stages listed.')
+	args = arg_parser.parse_args()
+
+	cli_audit_store = AuditStore(args.store)
+	if args.command == 'report':
+		render_report(summarize(cli_audit_store, args.top), args.output_format, sys.stdout)
+	elif args.output_format == 'html':
+		arg_parser.error('export supports the json and csv formats only')
+	else:
+		export_certificates(cli_audit_store, args.output_format, sys.stdout)
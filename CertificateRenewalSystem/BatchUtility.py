@@ -0,0 +1,36 @@
+#!/usr/bin/env python3
+
+# This is the utility file, that hosts the helper(s) for processing
+# a batch of certificates. The batch (i.e, the inventory) is consumed
+# lazily, so that its size never dictates the memory footprint.
+
+##################################################################
+# Module Import Section.
+##################################################################
+
+# Used for running the per certificate work in parallel.
+import concurrent.futures
+
+##################################################################
+
+def bounded_map(function, iterable, max_workers, max_in_flight=None):
+	'''
+	   Generator applying *function* to every item of *iterable* within a
+	   pool of *max_workers* threads, yielding the results in completion
+	   order.
+	   Unlike `Executor.map()`, which submits the whole iterable upfront,
+	   an item is only pulled from the *iterable* once a slot frees up.
+	   At most *max_in_flight* items (default: twice the workers) are
+	   submitted or running at any time, whatever the size of the batch.
+	'''
+	max_in_flight = max_in_flight or max_workers * 2
+	with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+		in_flight = set()
+		for item in iterable:
+			if len(in_flight) >= max_in_flight:
+				done, in_flight = concurrent.futures.wait(in_flight, return_when=concurrent.futures.FIRST_COMPLETED)
+				for future in done:
+					yield future.result()
+			in_flight.add(executor.submit(function, item))
+		for future in concurrent.futures.as_completed(in_flight):
+			yield future.result()
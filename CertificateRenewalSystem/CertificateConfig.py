@@ -0,0 +1,318 @@
+#!/usr/bin/env python3
+
+'''
+   This module holds the per-certificate Configuration Model. The modules
+   under the `config` package only act as the *defaults file* now. A
+   CertificateConfig object is built by layering the below sources (the
+   later source wins),
+
+   *********************************************
+   * 1. config.CSRConfig / config.PortalConfig *
+   * 2. Inventory row (one row per certificate) *
+   * 3. Environment overrides (CERT_RENEWAL_*)  *
+   *********************************************
+
+   The object is validated once, at build time, and cannot be altered
+   afterwards. It is passed explicitly into the CSRKeyGenerator and the
+   SubmitCSRToPortal classes, so that a single process can work on many
+   certificates having different settings.
+'''
+
+##################################################################
+# Module Import Section.
+# Make all the necessary imports within this section.
+# Don't Pollute the entire file, with imports here and there.
+##################################################################
+
+# Used for reading the certificate inventory file.
+import csv
+# To help out with OS level interactions.
+import os
+# Used for the field validations.
+import re
+
+# The defaults file(s).
+import config.CSRConfig
+import config.PortalConfig
+import config.SigningConfig
+
+##################################################################
+
+# Prefix for the Environment Variables that override a field.
+# For example, `CERT_RENEWAL_ISSUER_SERIAL` overrides `issuer_serial`.
+ENV_OVERRIDE_PREFIX = 'CERT_RENEWAL_'
+
+# Seperator for the list type fields (i.e, `san_list`), when supplied
+# through an inventory row or an environment variable.
+LIST_FIELD_SEPERATOR = ';'
+LIST_FIELDS          = ('san_list', 'serving_endpoints', 'part_issuer_serials',)
+
+# Validation Patterns.
+# The `app_name` names the CSR and Private Key files, host name characters only.
+APP_NAME_PATTERN      = re.compile(r'^[A-Za-z0-9]([A-Za-z0-9.-]{0,252})$')
+COUNTRY_PATTERN       = re.compile(r'^[A-Z]{2}$')
+ISSUER_SERIAL_PATTERN = re.compile(r'^[0-9A-Fa-f]{%d}$' % config.PortalConfig.ISSUER_SERIAL_LENGTH)
+JUR_HASH_PATTERN      = re.compile(r'^[0-9A-Fa-f]{%d}$' % config.PortalConfig.JUR_HASH_LENGTH)
+# The value shipped within the defaults file, for both the above.
+PLACEHOLDER_PATTERN   = re.compile(r'^X+$')
+EMAIL_PATTERN         = re.compile(r'^[^@\s]+@[^@\s]+\.[^@\s]+$')
+ENDPOINT_PATTERN      = re.compile(r'^(\[[0-9A-Fa-f:.]+\]|[^\s:\[\]]+)(:[0-9]{1,5})?$')
+
+class ConfigValidationError(ValueError):
+	'''
+	   Raised when a CertificateConfig fails validation. The *problems*
+	   attribute holds every problem found, not only the first one.
+	'''
+
+	def __init__(self, app_name, problems):
+		self.app_name = app_name
+		self.problems = list(problems)
+		super(ConfigValidationError, self).__init__('[{}] {}'.format(app_name, '; '.join(self.problems)))
+
+class CertificateConfig(object):
+	'''
+	   Immutable configuration for a single certificate.
+	   Derived values (file names, portal URLs, CSR prompt answers) are
+	   computed on access, so only the raw fields are held per instance.
+	'''
+
+	# The field names, in the order they are accepted by the constructor.
+	FIELDS = ('app_name', 'use_existing_csr', 'use_existing_pkey',
+			  'country', 'state', 'locality', 'organization', 'organizational_unit',
+			  'common_name', 'email_address', 'issuer_serial', 'jur_hash',
+			  'first_name', 'last_name', 'group_email', 'server_ip', 'purpose',
+			  'group_manager', 'server_category', 'server_application_type',
+			  'signature_algorithm', 'number_of_licenses', 'certificate_validity',
+			  'challenge_phrase', 'san_list', 'csr_directory_location',
+			  'pkey_directory_location', 'signing_backend', 'pkcs11_key_label',
+			  'base_url', 'serving_endpoints', 'renewed_certificate',
+			  'part_issuer_serials',)
+
+	__slots__ = FIELDS
+
+	def __init__(self, **fields):
+		'''
+		   Set the fields and validate them. Missing fields default to
+		   an empty value and are then reported by the validation.
+		'''
+		unknown_fields = set(fields) - set(self.FIELDS)
+		if unknown_fields:
+			raise ConfigValidationError(fields.get('app_name'), ['Unknown field(s): ' + ', '.join(sorted(unknown_fields))])
+		for field in self.FIELDS:
+			value = fields.get(field, '')
+			if field in LIST_FIELDS:
+				value = tuple(value or ())
+			object.__setattr__(self, field, value)
+		problems = self.validate()
+		if problems:
+			raise ConfigValidationError(self.app_name, problems)
+
+	def __setattr__(self, name, value):
+		raise AttributeError('CertificateConfig is immutable, cannot set: ' + name)
+
+	def __delattr__(self, name):
+		raise AttributeError('CertificateConfig is immutable, cannot delete: ' + name)
+
+	def __repr__(self):
+		return 'CertificateConfig(app_name={!r}, issuer_serial={!r})'.format(self.app_name, self.issuer_serial)
+
+	def replace(self, **changes):
+		'''
+		   Return a new (validated) CertificateConfig, with the *changes*
+		   applied to the fields of this one.
+		'''
+		fields = dict((field, getattr(self, field)) for field in self.FIELDS)
+		fields.update(changes)
+		return CertificateConfig(**fields)
+
+	def validate(self):
+		'''
+		   Return the list of problems found with the present field values.
+		   An empty list means the configuration is valid.
+		'''
+		problems = []
+		for field in ('app_name', 'state', 'locality', 'organization', 'organizational_unit',
+					  'common_name', 'issuer_serial', 'jur_hash', 'first_name', 'last_name',
+					  'signature_algorithm', 'number_of_licenses', 'certificate_validity',
+					  'csr_directory_location', 'pkey_directory_location', 'base_url',):
+			if not isinstance(getattr(self, field), str) or not getattr(self, field).strip():
+				problems.append('Field `{}` must be a non-empty string'.format(field))
+		if isinstance(self.app_name, str) and self.app_name and not APP_NAME_PATTERN.match(self.app_name):
+			problems.append('Field `app_name` must only hold host name characters (letters, digits, `.` and `-`): {!r}'.format(self.app_name))
+		if not COUNTRY_PATTERN.match(str(self.country)):
+			problems.append('Field `country` must be a two letter upper case code: {!r}'.format(self.country))
+		for field, pattern, length in (('issuer_serial', ISSUER_SERIAL_PATTERN, config.PortalConfig.ISSUER_SERIAL_LENGTH),
+									   ('jur_hash', JUR_HASH_PATTERN, config.PortalConfig.JUR_HASH_LENGTH),):
+			value = str(getattr(self, field))
+			if PLACEHOLDER_PATTERN.match(value):
+				problems.append('Field `{}` still holds the placeholder of config/PortalConfig'.format(field))
+			elif value and not pattern.match(value):
+				problems.append('Field `{}` must be {} hexadecimal digits: {!r}'.format(field, length, value))
+		for issuer_serial in self.part_issuer_serials:
+			if not ISSUER_SERIAL_PATTERN.match(str(issuer_serial)):
+				problems.append('Field `part_issuer_serials` entry must be {} hexadecimal digits: {!r}'.format(config.PortalConfig.ISSUER_SERIAL_LENGTH, issuer_serial))
+		for field in ('email_address', 'group_email'):
+			if not EMAIL_PATTERN.match(str(getattr(self, field))):
+				problems.append('Field `{}` is not a valid email address: {!r}'.format(field, getattr(self, field)))
+		for field in ('number_of_licenses', 'certificate_validity'):
+			if getattr(self, field) and not str(getattr(self, field)).isdigit():
+				problems.append('Field `{}` must be numeric: {!r}'.format(field, getattr(self, field)))
+		if self.signing_backend not in config.SigningConfig.SIGNING_BACKENDS:
+			problems.append('Field `signing_backend` must be one of {}: {!r}'.format(', '.join(config.SigningConfig.SIGNING_BACKENDS), self.signing_backend))
+		if not all(isinstance(san, str) for san in self.san_list):
+			problems.append('Field `san_list` must only hold strings')
+		for endpoint in self.serving_endpoints:
+			if not isinstance(endpoint, str) or not ENDPOINT_PATTERN.match(endpoint):
+				problems.append('Field `serving_endpoints` entry must be `host[:port]`: {!r}'.format(endpoint))
+		return problems
+
+	#****************************** DERIVED VALUES *******************************
+
+	@property
+	def csr_name(self):
+		return self.csr_directory_location + self.app_name + config.CSRConfig.CSR_EXTENSION
+
+	@property
+	def private_key_name(self):
+		return self.pkey_directory_location + self.app_name + config.CSRConfig.PKEY_EXTENSION
+
+	@property
+	def key_label(self):
+		'''
+		   The label of the Private Key, when it lives within a PKCS#11 token.
+		'''
+		return self.pkcs11_key_label or self.app_name
+
+	@property
+	def csr_info(self):
+		'''
+		   The list of values to be supplied to the OpenSSL Process.
+		'''
+		return [self.country, self.state, self.locality, self.organization,
+				self.organizational_unit, self.common_name, self.email_address,
+				config.CSRConfig.DEFAULT, config.CSRConfig.DEFAULT]
+
+	@property
+	def url_cert_details_page(self):
+		return config.PortalConfig.URL_CERT_DETAILS_PAGE.format(base_url=self.base_url, issuer_serial=self.issuer_serial, jur_hash=self.jur_hash)
+
+	def url_renew_page(self, csrf_token):
+		return config.PortalConfig.URL_RENEW_PAGE.format(base_url=self.base_url, issuer_serial=self.issuer_serial, csrf_token=csrf_token)
+
+	@property
+	def url_enroll_page(self):
+		return config.PortalConfig.URL_ENROLL_PAGE.format(base_url=self.base_url)
+
+	@property
+	def url_csr_submit_page(self):
+		return config.PortalConfig.URL_CSR_SUBMIT_PAGE.format(base_url=self.base_url)
+
+	#****************************** DERIVED VALUES *******************************
+
+def default_fields():
+	'''
+	   Read the defaults file(s) into a dictionary keyed by field name.
+	'''
+	return {
+			'app_name'               : config.CSRConfig.APP_NAME,
+			'use_existing_csr'       : config.CSRConfig.USE_EXISTING_CSR,
+			'use_existing_pkey'      : config.CSRConfig.USE_EXISTING_PKEY,
+			'country'                : config.CSRConfig.COUNTRY,
+			'state'                  : config.CSRConfig.STATE,
+			'locality'               : config.CSRConfig.LOCALITY,
+			'organization'           : config.CSRConfig.ORGANIZATION,
+			'organizational_unit'    : config.CSRConfig.ORGANIZATIONAL_UNIT,
+			# The below two default to the `APP_NAME` of the certificate.
+			'common_name'            : config.CSRConfig.COMMON_NAME,
+			'email_address'          : config.CSRConfig.EMAIL_ADDRESS,
+			'issuer_serial'          : config.PortalConfig.ISSUER_SERIAL,
+			'jur_hash'               : config.PortalConfig.JUR_HASH,
+			'first_name'             : config.PortalConfig.FIRST_NAME,
+			'last_name'              : config.PortalConfig.LAST_NAME,
+			'group_email'            : config.PortalConfig.GROUP_EMAIL,
+			'server_ip'              : config.PortalConfig.SERVER_IP,
+			'purpose'                : config.PortalConfig.PURPOSE,
+			'group_manager'          : config.PortalConfig.GROUP_MANAGER,
+			'server_category'        : config.PortalConfig.SERVER_CATEGORY,
+			'server_application_type': config.PortalConfig.SERVER_APPLICATION_TYPE,
+			'signature_algorithm'    : config.PortalConfig.SIGNATURE_ALGORITHM,
+			'number_of_licenses'     : config.PortalConfig.NUMBER_OF_LICENSES,
+			'certificate_validity'   : config.PortalConfig.CERTIFICATE_VALIDITY,
+			'challenge_phrase'       : config.PortalConfig.CHALLENGE_PHRASE,
+			'san_list'               : config.PortalConfig.SAN_LIST,
+			'csr_directory_location' : config.CSRConfig.CSR_DIRECTORY_LOCATION,
+			'pkey_directory_location': config.CSRConfig.PKEY_DIRECTORY_LOCATION,
+			'signing_backend'        : config.SigningConfig.SIGNING_BACKEND,
+			'pkcs11_key_label'       : '',
+			'base_url'               : config.PortalConfig.BASE_URL,
+			# Where the certificate is deployed, and the renewed certificate
+			# (PEM) which should be served there. See `VerifyDeployment.py`.
+			'serving_endpoints'      : [],
+			'renewed_certificate'    : '',
+			# The certificates taking the SANs over the CA's limit, see
+			# `SANEngine.py`.
+			'part_issuer_serials'    : [],
+		   }
+
+def _coerce_field(field, value):
+	'''
+	   Convert a raw string value (inventory cell / environment variable)
+	   into the type expected by the field.
+	'''
+	if field in LIST_FIELDS:
+		return [item.strip() for item in value.split(LIST_FIELD_SEPERATOR) if item.strip()]
+	if field in ('use_existing_csr', 'use_existing_pkey'):
+		# An empty value means the option is not set.
+		return value or config.CSRConfig.VALUE_NOT_SET
+	return value
+
+def build_certificate_config(inventory_row=None, environ=None):
+	'''
+	   Build a validated CertificateConfig by layering the defaults file,
+	   the inventory row and the environment overrides (in that order).
+	   Empty inventory cells do not override the defaults.
+	   Raises ConfigValidationError, listing all the problems found.
+	'''
+	fields = default_fields()
+	derived_defaults = {
+						'common_name': config.CSRConfig.APP_NAME,
+						'purpose'    : config.PortalConfig.PURPOSE,
+					   }
+	# The fields set by the inventory row or the environment.
+	supplied_fields = set()
+
+	for field, value in (inventory_row or {}).items():
+		if field is None:
+			# Extra cells in a malformed CSV row.
+			raise ConfigValidationError(inventory_row.get('app_name'), ['Inventory row has more cells than columns'])
+		field = field.strip().lower()
+		if value is not None and value.strip():
+			fields[field] = _coerce_field(field, value.strip())
+			supplied_fields.add(field)
+
+	environ = os.environ if environ is None else environ
+	for field in CertificateConfig.FIELDS:
+		env_name = ENV_OVERRIDE_PREFIX + field.upper()
+		if env_name in environ:
+			fields[field] = _coerce_field(field, environ[env_name])
+			supplied_fields.add(field)
+
+	# Fields derived from `APP_NAME` in the defaults file follow the
+	# certificate's own `app_name`, unless explicitly set.
+	if fields['app_name'] != config.CSRConfig.APP_NAME:
+		if 'common_name' not in supplied_fields and fields['common_name'] == derived_defaults['common_name']:
+			fields['common_name'] = fields['app_name']
+		if 'purpose' not in supplied_fields and fields['purpose'] == derived_defaults['purpose']:
+			fields['purpose'] = config.PortalConfig.PURPOSE_TEMPLATE.format(fields['app_name'])
+
+	return CertificateConfig(**fields)
+
+def read_inventory(inventory_file_name):
+	'''
+	   Generator yielding the inventory rows (as dictionaries), one at a
+	   time. The inventory is a CSV file whose header row holds the field
+	   names of the CertificateConfig (any subset, `app_name` is required).
+	'''
+	with open(inventory_file_name, 'r', newline='') as inventory_file_obj:
+		for inventory_row in csv.DictReader(inventory_file_obj):
+			yield inventory_row
@@ -6,10 +6,10 @@
 '''
    This module holds the Class Definition to generate the CSR (Certificate
    Signing Request) and the server's Private Key for furthering the Certificate
-   Generation procedure. This Utility makes use of the OpenSSL Tool to perform
-   the various operations related to CSR and Private-Key generation.
-   The various methods/interfaces exposed by the below Class(s), only act as a
-   wrapper for the OpenSSL Tool.
+   Generation procedure. The Private Key and the CSR signing are handled by
+   the certificate's signing backend (see `SigningBackend.py`), by default
+   the OpenSSL Tool. The below Class(s) decide whether a CSR is required and
+   store it in the CSR store.
 '''
 
 ##################################################################
@@ -24,15 +24,18 @@ import getpass
 import time
 # The below library utility provides the system's information.
 import platform
-# Below module handles subprocesses and their interaction.
-import subprocess, io
-# Below module holds the configuration options for the CSR
+# Below module builds the per-certificate configuration for the CSR
 # generation.
-import config.CSRConfig
+import CertificateConfig
+# Below module holds the signing backend(s), which own the Private Key
+# and sign the CSR (OpenSSL, or a PKCS#11 token).
+import SigningBackend
 # Logging Module to enable this application to log its events.
 import logging
 # To help out with OS level interactions.
 import os
+# Used for aborting on an invalid configuration.
+import sys
 
 ##################################################################
 
@@ -54,115 +57,79 @@ class CSRKeyGenerator(object):
 	   Generate the *CSR* and the *Private Key*.
 	'''
 
-	def __init__(self):
+	def __init__(self, cert_config, signing_backend):
 		'''
 		   Perform certain Environment Information Initialization.
 		   Below information can be logged, for auditing purposes.
+		   The *cert_config* parameter is the (already validated)
+		   CertificateConfig object of the certificate to work on.
+		   The *signing_backend* parameter (see `SigningBackend.py`) holds
+		   the Private Key and signs the CSR.
 		'''
+		self.cert_config = cert_config
+		self.signing_backend = signing_backend
 		self.time      = time.ctime()
 		self.user      = getpass.getuser()
 		self.host      = platform.node()
 		self.os_info   = platform.system()
 		# Log a comment.
-		csr_pkey_gen_logger.info('[Time: %s, User: %s, Host: %s, OS_INFO: %s]', self.time, self.user, self.host, self.os_info)
+		csr_pkey_gen_logger.info('[Time: %s, User: %s, Host: %s, OS_INFO: %s, APP_NAME: %s]', self.time, self.user, self.host, self.os_info, self.cert_config.app_name)
 
-	def generate_csr_pkey(self, use_existing_pkey=None):
+	def generate_csr_with_backend(self):
 		'''
-		   Wrapper for calling OpenSSL Tool. This is a sub-part
-		   into the entire process. In this part, the utility issues
-		   a CSR generation command via OpenSSL.
+		   Have the signing backend generate (or reuse) the Private Key and
+		   sign the CSR. The CSR is written to the CSR store.
 		'''
+		# Build the CSR store directory location, if it does not exist.
+		# Other certificates of the batch may be creating it concurrently.
+		os.makedirs(self.cert_config.csr_directory_location, exist_ok=True)
 
-		# Build the CSR store and Private Key store directory locations.
-		# First check if it exists, if not create it.
-		# Check for the CSR output directory location.
-		if not os.path.exists(config.CSRConfig.CSR_DIRECTORY_LOCATION):
-			os.mkdir(config.CSRConfig.CSR_DIRECTORY_LOCATION)
-
-		# Check for the PRIVATE KEY output directory location as well.
-		if not os.path.exists(config.CSRConfig.PKEY_DIRECTORY_LOCATION):
-			os.mkdir(config.CSRConfig.PKEY_DIRECTORY_LOCATION)
-
-		if use_existing_pkey:
-			# We only create a new CSR. We will be
-			# using the existing PKEY, when installing
-			# the `CERTIFICATE`.
-			openssl_command = 'openssl req -out ' + \
-							  config.CSRConfig.CSR_NAME + \
-							  ' -key ' + use_existing_pkey + ' -new'
-		else:
-			# Generate a new CSR and PKEY pair.
-			openssl_command = 'openssl req -out ' + \
-							  config.CSRConfig.CSR_NAME + \
-							  ' -new -newkey rsa:2048 -nodes -keyout ' + \
-							  config.CSRConfig.PRIVATE_KEY_NAME
-
-		# Create a PIPED OpenSSL Sub-Process.
-		proc = subprocess.Popen(openssl_command, shell=True,
-												 stdin=subprocess.PIPE,
-												 stdout=subprocess.PIPE,)
-		
-		# Log a comment
-		csr_pkey_gen_logger.info('Subprocess and PIPE Instantiated.')
-		
-		# Instantiate the STDIN stream for the PIPED Process.
-		stdin = io.TextIOWrapper(proc.stdin, encoding='utf-8',
-											 line_buffering=True,)
-		# Perform the same as well for the STDOUT stream.
-		stdout = io.TextIOWrapper(proc.stdout, encoding='utf-8',)
-		
-		# Log a comment
-		csr_pkey_gen_logger.info('STDIN and STDOUT have been Instantiated.')
-
-		# Output Start Marker.
-		print('\n********************** SUBPROCESS OUTPUT *********************\n')
-
-		# Start sending the certificate information to the subprocess
-		# prompt. This data should be kept seperate in a configuration
-		# file, as it is subject to change based on the CSR requirement.
-		for info in config.CSRConfig.CSR_INFO:
-			# Append the new-line to the input to seperate out
-			# the passed in data.
-			info_line = '{}\n'.format(info)
-			# Write the data to the OpenSSL process.
-			stdin.write(info_line)
-			
-			# Log a comment
-			csr_pkey_gen_logger.debug('Passing in value: %s', info_line)
-
-		# Get the remaining output from the child process and
-		# display it on screen.
-		remaining_proc_out = proc.communicate()[0].decode('utf-8')
-		print(remaining_proc_out)
-
-		# Output End Marker.
-		print('\n********************** SUBPROCESS OUTPUT *********************\n')
+		csr_content = self.signing_backend.generate_csr(self.cert_config)
+		with open(self.cert_config.csr_name, 'w') as csr_file_obj:
+			csr_file_obj.write(csr_content)
+		# Log a comment.
+		csr_pkey_gen_logger.info('CSR signed by the %s signing backend.', self.cert_config.signing_backend)
+
+	def generate_if_required(self):
+		'''
+		   Go for CSR creation, iff you do not have the old existing CSR.
+		   Whether an existing Private Key is reused is up to the signing
+		   backend. Returns the CSR file name to be used for the submission.
+		'''
+		cert_config = self.cert_config
+		# Also do check that the CSR is not present in the CSR store, within
+		# the program's home directory.
+		has_existing_csr = bool(cert_config.use_existing_csr) and os.path.isfile(cert_config.use_existing_csr)
+		if not has_existing_csr and not os.path.isfile(cert_config.csr_name):
+			# Initiate Generation.
+			csr_pkey_gen_logger.info('Generating CSR via the %s signing backend.', cert_config.signing_backend)
+			self.generate_csr_with_backend()
+			return cert_config.csr_name
+		csr_file_name = cert_config.use_existing_csr or cert_config.csr_name
+		csr_pkey_gen_logger.info('Using Existing CSR: %s', csr_file_name)
+		return csr_file_name
 
 # Execute Module Code.
 # Just load the Module, in case it's not run as a stand-alone program.
 if __name__ == '__main__':
-	# Go for CSR creation, iff you do not have the old existing CSR and its
-	# corresponding P_KEY.
-	if not os.path.isfile(config.CSRConfig.USE_EXISTING_CSR) and not os.path.isfile((config.CSRConfig.CSR_NAME)):
+	# Build the certificate configuration from the defaults file and the
+	# environment overrides.
+	try:
+		cert_config = CertificateConfig.build_certificate_config()
+	except CertificateConfig.ConfigValidationError as config_err:
+		csr_pkey_gen_logger.error('EXCEPTION_OCCURED::[CONFIG_VALIDATION]::ABORTING::' + str(config_err))
+		sys.exit(1)
+
+	signing_backends = {}
+	try:
 		# Instantiating the CSR and Key Generator Class.
-		csr_pkey_generator = CSRKeyGenerator()
+		csr_pkey_generator = CSRKeyGenerator(cert_config, SigningBackend.get_signing_backend(cert_config.signing_backend, signing_backends))
 		# Log a comment.
 		csr_pkey_gen_logger.info('Instantiated Certificate Generator Object.')
-		
-		# Now time to check whether we have an existing PKEY.
-		if not os.path.isfile(config.CSRConfig.USE_EXISTING_PKEY) and not os.path.isfile(config.CSRConfig.PRIVATE_KEY_NAME):
-			# This will generate a brand new CSR and PKEY pair.
-			# Initiate Generation.
-			csr_pkey_gen_logger.info('Generating CSR and Private Key.')
-			csr_pkey_generator.generate_csr_pkey()
-		else:
-			# This will generate a CSR based on the existing PKEY.
-			# The PKEY to use might be in some other directory location or it
-			# might be in the program's home directory's PKEY store.
-			pkey_file_location = config.CSRConfig.USE_EXISTING_PKEY or config.CSRConfig.PRIVATE_KEY_NAME
-			# Initiate Generation.
-			csr_pkey_gen_logger.info('Generating CSR from Existing Private Key.')
-			csr_pkey_generator.generate_csr_pkey(use_existing_pkey=pkey_file_location)
-		csr_pkey_gen_logger.info('CSR and Private Key have been generated in the presently configured directory.')
-	else:
-		csr_pkey_gen_logger.info('Using Existing CSR: %s', (config.CSRConfig.USE_EXISTING_CSR or config.CSRConfig.CSR_NAME))
+		csr_pkey_generator.generate_if_required()
+	except SigningBackend.SigningBackendError as signing_err:
+		csr_pkey_gen_logger.error('EXCEPTION_OCCURED::[SIGNING_BACKEND]::ABORTING::' + str(signing_err))
+		sys.exit(1)
+	finally:
+		for signing_backend in signing_backends.values():
+			signing_backend.close()
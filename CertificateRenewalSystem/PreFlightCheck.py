@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+
+'''
+   This module holds the Pre-Flight validation stage. Every certificate of
+   a batch is checked up front, before any Private Key is generated or any
+   request is made to the Certificate Authorities' portal. All the problems
+   found are reported in one pass, so that a job bound to fail never burns
+   key generation time or the CA's rate-limit budget.
+
+   The checks performed are,
+   **************************************************************
+   * CONFIG      -> The CertificateConfig builds and validates. *
+   * KEY_CSR     -> An existing Private Key matches the         *
+   *                existing CSR (same public key).             *
+   * SAN         -> SAN syntax, the CA's SAN limit, and that an *
+   *                existing CSR holds the configured SANs.     *
+   * PERMISSIONS -> The Private Key store is writable and the   *
+   *                keys in it are not group/world readable.    *
+   * AGREEMENT   -> The Service Agreement asset is readable.    *
+   * SIGNING     -> The PKCS#11 module and User PIN are set up, *
+   *                for certificates signed within a token.     *
+   * INTERNAL    -> A check itself failed unexpectedly.         *
+   **************************************************************
+'''
+
+##################################################################
+# Module Import Section.
+# Make all the necessary imports within this section.
+# Don't Pollute the entire file, with imports here and there.
+##################################################################
+
+# Logging Module to enable this application to log its events.
+import logging
+# To help out with OS level interactions.
+import os
+# Used for file permission inspection.
+import stat
+# Below module handles subprocesses and their interaction.
+import subprocess
+# Used for reading the SANs out of an existing CSR.
+import re
+
+import BatchUtility
+import CertificateConfig
+import SANEngine
+import config.CSRConfig
+import config.PortalConfig
+import config.SigningConfig
+import SigningBackend
+
+##################################################################
+
+##################################################################
+# Setting up the logger Instance.
+
+import LoggerUtility
+import config.LoggerConfig
+
+PRE_FLIGHT_LOGGER_NAME = '.PreFlightCheck'
+
+# Instantiate the module level Logger object.
+pre_flight_logger = logging.getLogger(config.LoggerConfig.APP_LOGGER_NAME + PRE_FLIGHT_LOGGER_NAME)
+
+##################################################################
+
+# Number of certificates checked in parallel.
+# The checks mostly wait on the OpenSSL subprocess and the file system.
+DEFAULT_MAX_WORKERS = 8
+
+# Stands for the whole batch, in the failures of the shared checks.
+SHARED_APP_NAME = '<ALL>'
+
+# A DNS name of the SAN extension, in the OpenSSL Tool's text output.
+CSR_DNS_SAN_PATTERN = re.compile(r'DNS:([^,\s]+)')
+
+def _openssl_output(openssl_args):
+	'''
+	   Run the OpenSSL Tool, e.g. to extract a public key (PEM).
+	   Returns `None` if OpenSSL fails to read the input.
+	'''
+	proc = subprocess.Popen(['openssl'] + openssl_args,
+							stdin=subprocess.DEVNULL,
+							stdout=subprocess.PIPE,
+							stderr=subprocess.PIPE,)
+	proc_out = proc.communicate()[0]
+	if proc.returncode:
+		return None
+	return proc_out.strip()
+
+def check_key_csr_consistency(csr_file_name, pkey_file_name):
+	'''
+	   Check that an existing Private Key and an existing CSR belong together.
+	   Returns the list of problems found.
+	'''
+	csr_public_key = _openssl_output(['req', '-noout', '-pubkey', '-in', csr_file_name])
+	if csr_public_key is None:
+		return ['[KEY_CSR] Unable to read the CSR: ' + csr_file_name]
+	pkey_public_key = _openssl_output(['pkey', '-pubout', '-passin', 'pass:', '-in', pkey_file_name])
+	if pkey_public_key is None:
+		return ['[KEY_CSR] Unable to read the Private Key: ' + pkey_file_name]
+	if csr_public_key != pkey_public_key:
+		return ['[KEY_CSR] The Private Key {} does not match the CSR {}'.format(pkey_file_name, csr_file_name)]
+	return []
+
+def existing_csr_file_name(cert_config):
+	'''
+	   The existing CSR the renewal would reuse rather than generate (see
+	   `KeyCSRGenerator.py`), `None` if there is none.
+	'''
+	for candidate in (cert_config.use_existing_csr, cert_config.csr_name):
+		if candidate and os.path.isfile(candidate):
+			return candidate
+	return None
+
+def check_csr_sans(cert_config, csr_file_name):
+	'''
+	   An existing CSR is submitted as is, so it must hold the very SANs
+	   of the certificate's configuration. Returns the list of problems found.
+	'''
+	csr_text = _openssl_output(['req', '-noout', '-text', '-in', csr_file_name])
+	if csr_text is None:
+		return ['[SAN] Unable to read the CSR: ' + csr_file_name]
+	csr_sans = set(SANEngine.normalize_san(san) for san in CSR_DNS_SAN_PATTERN.findall(csr_text.decode('utf-8', 'replace')))
+	expected_sans = set(SANEngine.build_san_set(cert_config).names)
+	if csr_sans != expected_sans:
+		return ['[SAN] The CSR {} does not hold the configured SANs, missing: {} / unexpected: {}'.format(
+				csr_file_name, sorted(expected_sans - csr_sans), sorted(csr_sans - expected_sans))]
+	return []
+
+def check_san_list(cert_config):
+	'''
+	   Check the syntax of the certificate's SANs, that the SANs over the
+	   CA's limit have certificates to go to (see `SANEngine.py`), and that
+	   the existing CSR of each of those holds its SANs.
+	   Duplicated names are dropped by the SAN engine, not reported.
+	   Returns the list of problems found.
+	'''
+	problems = ['[SAN] Invalid SAN: {!r}'.format(san) for san in SANEngine.build_san_set(cert_config).invalid]
+	if not problems:
+		try:
+			part_configs = SANEngine.partition_certificate(cert_config)
+		except CertificateConfig.ConfigValidationError as partition_err:
+			problems.extend('[SAN] ' + problem for problem in partition_err.problems)
+		else:
+			for part_config in part_configs:
+				csr_file_name = existing_csr_file_name(part_config)
+				if csr_file_name:
+					problems.extend(check_csr_sans(part_config, csr_file_name))
+	return problems
+
+def check_pkey_store_permissions(cert_config, existing_pkey_file_name):
+	'''
+	   The Private Key store must be writable (or creatable) and an existing
+	   Private Key must not be readable by the group or others.
+	   Returns the list of problems found.
+	'''
+	problems = []
+	pkey_directory = cert_config.pkey_directory_location
+	if os.path.isdir(pkey_directory):
+		if not os.access(pkey_directory, os.W_OK | os.X_OK):
+			problems.append('[PERMISSIONS] Private Key store is not writable: ' + pkey_directory)
+	elif os.path.exists(pkey_directory):
+		problems.append('[PERMISSIONS] Private Key store is not a directory: ' + pkey_directory)
+	elif not os.access(os.path.dirname(os.path.abspath(pkey_directory.rstrip('/'))), os.W_OK):
+		problems.append('[PERMISSIONS] Private Key store cannot be created: ' + pkey_directory)
+
+	if existing_pkey_file_name:
+		if not os.access(existing_pkey_file_name, os.R_OK):
+			problems.append('[PERMISSIONS] Private Key is not readable: ' + existing_pkey_file_name)
+		elif os.stat(existing_pkey_file_name).st_mode & (stat.S_IRWXG | stat.S_IRWXO):
+			problems.append('[PERMISSIONS] Private Key is accessible by group/others: ' + existing_pkey_file_name)
+	return problems
+
+def check_agreement_asset():
+	'''
+	   The Service Agreement notes are only needed at the very last portal
+	   step, so make sure they are readable before the first one.
+	   Returns the list of problems found.
+	'''
+	try:
+		with open(config.PortalConfig.AGREEMENT_FILE_NAME, 'r') as agreement_file_obj:
+			if not agreement_file_obj.read(1):
+				return ['[AGREEMENT] Service Agreement file is empty: ' + config.PortalConfig.AGREEMENT_FILE_NAME]
+	except (IOError, OSError) as agreement_file_err:
+		return ['[AGREEMENT] ' + str(agreement_file_err)]
+	return []
+
+def check_pkcs11_setup():
+	'''
+	   The token itself is only opened by the first signing, check what
+	   can be checked without logging in. Returns the list of problems found.
+	'''
+	problems = []
+	if SigningBackend.pkcs11 is None:
+		problems.append('[SIGNING] The PKCS#11 signing backend requires the `python-pkcs11` and `asn1crypto` modules')
+	if not os.path.isfile(config.SigningConfig.PKCS11_MODULE):
+		problems.append('[SIGNING] PKCS#11 module not found: ' + config.SigningConfig.PKCS11_MODULE)
+	if not os.environ.get(config.SigningConfig.PKCS11_USER_PIN_ENV):
+		problems.append('[SIGNING] PKCS#11 User PIN is not set, export ' + config.SigningConfig.PKCS11_USER_PIN_ENV)
+	return problems
+
+def check_certificate(inventory_row):
+	'''
+	   Run every per certificate check against one inventory row (`None`
+	   stands for the defaults file). Returns a tuple of the certificate
+	   name, the list of problems found and whether the certificate is
+	   signed within a PKCS#11 token (the token setup is checked once for
+	   the whole batch, by `run_pre_flight`). An unexpected error is
+	   reported as a problem of the row, the other rows are still checked.
+	'''
+	try:
+		return _check_certificate(inventory_row)
+	except Exception as check_err:
+		pre_flight_logger.exception('EXCEPTION_OCCURED::[PRE_FLIGHT]::' + str(check_err))
+		app_name = (inventory_row or {}).get('app_name') or config.CSRConfig.APP_NAME
+		return (app_name, ['[INTERNAL] {}: {}'.format(check_err.__class__.__name__, check_err)], False)
+
+def _check_certificate(inventory_row):
+	app_name = (inventory_row or {}).get('app_name') or config.CSRConfig.APP_NAME
+	try:
+		cert_config = CertificateConfig.build_certificate_config(inventory_row)
+	except CertificateConfig.ConfigValidationError as config_err:
+		# Nothing else can be reliably checked without a valid configuration.
+		return (app_name, ['[CONFIG] ' + problem for problem in config_err.problems], False)
+
+	# Figure out the CSR and the Private Key that would be used.
+	csr_file_name = existing_csr_file_name(cert_config)
+	pkey_file_name = None
+	for candidate in (cert_config.use_existing_pkey, cert_config.private_key_name):
+		if candidate and os.path.isfile(candidate):
+			pkey_file_name = candidate
+			break
+	uses_pkcs11 = cert_config.signing_backend == config.SigningConfig.SIGNING_BACKEND_PKCS11
+
+	problems = []
+	for configured_file_name, label in ((cert_config.use_existing_csr, 'CSR'), (cert_config.use_existing_pkey, 'Private Key')):
+		if configured_file_name and not os.path.isfile(configured_file_name):
+			problems.append('[CONFIG] Configured existing {} does not exist: {}'.format(label, configured_file_name))
+	# With PKCS#11, the Private Key never touches the PKEY store.
+	if not uses_pkcs11 and csr_file_name and pkey_file_name:
+		problems.extend(check_key_csr_consistency(csr_file_name, pkey_file_name))
+	problems.extend(check_san_list(cert_config))
+	if not cert_config.san_list:
+		# Not a problem as such, the SANs on the portal are only known at
+		# submission, where any SAN missing from the list fails the certificate.
+		pre_flight_logger.warning('PRE_FLIGHT::[%s]::[SAN] Field `san_list` is empty, every SAN already on the portal must be listed', cert_config.app_name)
+	if not uses_pkcs11:
+		problems.extend(check_pkey_store_permissions(cert_config, pkey_file_name))
+	return (cert_config.app_name, problems, uses_pkcs11)
+
+def run_pre_flight(inventory_rows, max_workers=DEFAULT_MAX_WORKERS):
+	'''
+	   Check every certificate of the batch in parallel and return the
+	   list of `(app_name, problems)` tuples, for the failing ones only.
+	   An empty list means the whole batch is good to go.
+	'''
+	failures = []
+	shared_problems = check_agreement_asset()
+	if shared_problems:
+		failures.append((SHARED_APP_NAME, shared_problems))
+
+	seen_app_names = set()
+	checked_count  = 0
+	uses_pkcs11    = False
+	# The inventory is pulled lazily, only the failures are kept around.
+	for app_name, problems, certificate_uses_pkcs11 in BatchUtility.bounded_map(check_certificate, inventory_rows, max_workers):
+		uses_pkcs11 = uses_pkcs11 or certificate_uses_pkcs11
+		# Two rows for the same certificate would clobber each other's
+		# CSR and Private Key files.
+		if app_name in seen_app_names:
+			problems = problems + ['[CONFIG] Certificate is listed more than once in the inventory']
+		seen_app_names.add(app_name)
+		checked_count += 1
+		if problems:
+			failures.append((app_name, problems))
+	# The token setup is shared by all the certificates using it.
+	if uses_pkcs11:
+		shared_problems = check_pkcs11_setup()
+		if shared_problems:
+			failures.append((SHARED_APP_NAME, shared_problems))
+
+	# Log a comment for each problem found.
+	for app_name, problems in failures:
+		for problem in problems:
+			pre_flight_logger.error('PRE_FLIGHT::[%s]::%s', app_name, problem)
+	failing_app_names = set(app_name for app_name, problems in failures) - set([SHARED_APP_NAME])
+	pre_flight_logger.info('Pre-Flight check completed for %s certificate(s), %s failing.', checked_count, len(failing_app_names))
+	return failures
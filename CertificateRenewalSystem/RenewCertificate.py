@@ -18,112 +18,253 @@
 
 import KeyCSRGenerator
 import SubmitCSR
-import config.PortalConfig
+import CertificateConfig
+import PreFlightCheck
+import SigningBackend
+import AuditTrail
+import BatchUtility
+import SANEngine
+import StageProfiler
+import config.AuditConfig
+import config.ProfileConfig
 import requests
 import sys
+# Used for parsing the command line options.
+import argparse
+# Used for the profile output location.
 import os
-import config.CSRConfig
 
 ####################################################################
 
-# Start the Certificate Renewal Process.
-# The process needs the CSR and Private Key to be generated,
-# before submitting off the request to the Certificate Issuers'
-# portal.
-
-# Go for CSR creation, iff you do not have the old existing CSR and its
-# corresponding P_KEY.
-# Also do check that the CSR is not present in the CSR store, within the
-# program's home directory.
-if not os.path.isfile(config.CSRConfig.USE_EXISTING_CSR) and not os.path.isfile((config.CSRConfig.CSR_NAME)):
-	# Instantiating the CSR and Key Generator Class.
-	csr_pkey_generator = KeyCSRGenerator.CSRKeyGenerator()
-	# Log a comment.
-	KeyCSRGenerator.csr_pkey_gen_logger.info('Instantiated Certificate Generator Object.')
-	
-	# Now time to check whether we have an existing PKEY.
-	if not os.path.isfile(config.CSRConfig.USE_EXISTING_PKEY) and not os.path.isfile(config.CSRConfig.PRIVATE_KEY_NAME):
-		# This will generate a brand new CSR and PKEY pair.
-		# Initiate Generation.
-		KeyCSRGenerator.csr_pkey_gen_logger.info('Generating CSR and Private Key.')
-		csr_pkey_generator.generate_csr_pkey()
+def renew_certificate(cert_config, signing_backends, renewal_run, renewed_sans=None):
+	'''
+	   Run the entire renewal workflow for a single certificate, as
+	   described by the *cert_config* (CertificateConfig) object.
+	   The *signing_backends* dictionary caches the signing backend(s)
+	   shared by all the certificates of the run. The certificate's stage
+	   timings and outcome are recorded within the *renewal_run* audit.
+	   The *renewed_sans* are the SANs of all the parts of a partitioned
+	   certificate, none of the SANs on the portal may go missing from them.
+	   Returns `True` on success, `False` otherwise, unexpected errors
+	   included: they fail this certificate only, not the batch.
+	'''
+	cert_audit = renewal_run.certificate(cert_config.app_name)
+	succeeded  = False
+	try:
+		succeeded = _renew_certificate(cert_config, signing_backends, cert_audit, renewed_sans)
+	except Exception as renewal_err:
+		# Log the traceback and move on, the failed stage is audited.
+		SubmitCSR.csr_uploader_logger.exception('EXCEPTION_OCCURED::[UNEXPECTED]::SKIPPING::[{}] {}'.format(cert_config.app_name, renewal_err))
+	finally:
+		cert_audit.finish(succeeded)
+	return succeeded
+
+def _renew_certificate(cert_config, signing_backends, cert_audit, renewed_sans):
+	# Start the Certificate Renewal Process.
+	# The process needs the CSR and Private Key to be generated,
+	# before submitting off the request to the Certificate Issuers'
+	# portal.
+	with cert_audit.stage(config.AuditConfig.STAGE_CSR_GENERATION):
+		try:
+			# Instantiating the CSR and Key Generator Class.
+			csr_pkey_generator = KeyCSRGenerator.CSRKeyGenerator(cert_config, SigningBackend.get_signing_backend(cert_config.signing_backend, signing_backends))
+			# Log a comment.
+			KeyCSRGenerator.csr_pkey_gen_logger.info('Instantiated Certificate Generator Object.')
+
+			# Go for CSR creation, iff you do not have the old existing CSR and its
+			# corresponding P_KEY.
+			# Let's get CSR data ready for submission.
+			# First lets determine the CSR file and prepare the content for submission.
+			csr_file_name = csr_pkey_generator.generate_if_required()
+		except SigningBackend.SigningBackendError as signing_err:
+			# Log a comment and abort.
+			KeyCSRGenerator.csr_pkey_gen_logger.error('EXCEPTION_OCCURED::[SIGNING_BACKEND]::ABORTING::' + str(signing_err))
+			return False
+
+		# Use the `with as` context management protocol.
+		# This handles the proper closing of open files and spares us from
+		# doing it manually.
+		try:
+			with open(csr_file_name, 'r') as csr_file_obj:
+				csr_content = csr_file_obj.read()
+		except (IOError, OSError) as csr_file_err:
+			# Log a comment and abort.
+			SubmitCSR.csr_uploader_logger.error('EXCEPTION_OCCURED::[CSR_FILE_ACCESS]::ABORTING::' + str(csr_file_err))
+			return False
+		cert_audit.record_csr(csr_content)
+
+	# Now handing over the charge to the Online CSR submission Process.
+	# This process performs the task of uploading the software generated
+	# CSR to the Certificate Authority via the portal.
+	# Instantiate a CSR Submission Bot.
+	csr_submission_bot = SubmitCSR.SubmitCSRToPortal(cert_config, renewed_sans)
+
+	try:
+		return _submit_csr(cert_config, csr_content, csr_submission_bot, cert_audit)
+	finally:
+		# Release the session (and its connection pool) right away.
+		csr_submission_bot.close()
+
+def _submit_csr(cert_config, csr_content, csr_submission_bot, cert_audit):
+	'''
+	   Walk the CA portal, from the Certificate Details Page to the CSR
+	   submission. Returns `True` on success, `False` otherwise.
+	'''
+	# Request the Certificate Details Page.
+	# This is the initial page in the entire flow.
+	with cert_audit.stage(config.AuditConfig.STAGE_DETAILS_PAGE):
+		csrf_token, details_resp_code = csr_submission_bot.get_cert_details(cert_config.url_cert_details_page)
+	cert_audit.record_response(config.AuditConfig.STAGE_DETAILS_PAGE, details_resp_code)
+
+	# Check the response to fetching the Details Page.
+	if details_resp_code == requests.codes.ok and not csr_submission_bot.failure:
+		# Imitate clicking on the Renew Option.
+		renew_url = cert_config.url_renew_page(csrf_token)
+		with cert_audit.stage(config.AuditConfig.STAGE_RENEW_PAGE):
+			renew_resp_code = csr_submission_bot.select_renew_option(renew_url)
+		cert_audit.record_response(config.AuditConfig.STAGE_RENEW_PAGE, renew_resp_code)
 	else:
-		# This will generate a CSR based on the existing PKEY.
-		# The PKEY to use might be in some other directory location or it
-		# might be in the program's home directory's PKEY store.
-		pkey_file_location = config.CSRConfig.USE_EXISTING_PKEY or config.CSRConfig.PRIVATE_KEY_NAME
-		# Initiate Generation.
-		KeyCSRGenerator.csr_pkey_gen_logger.info('Generating CSR from Existing Private Key.')
-		csr_pkey_generator.generate_csr_pkey(use_existing_pkey=pkey_file_location)
-	KeyCSRGenerator.csr_pkey_gen_logger.info('CSR and Private Key have been generated in the presently configured directory.')
-else:
-	KeyCSRGenerator.csr_pkey_gen_logger.info('Using Existing CSR: %s', (config.CSRConfig.USE_EXISTING_CSR or config.CSRConfig.CSR_NAME))
-
-# Let's get CSR data ready for submission.
-# We will read it to a variable.
-# First lets determine the CSR file and prepare the content for submission.
-csr_file_name = config.CSRConfig.USE_EXISTING_CSR or config.CSRConfig.CSR_NAME
-
-# Use the `with as` context management protocol.
-# This handles the proper closing of open files and spares us from
-# doing it manually.
-try:
-	with open(csr_file_name, 'r') as csr_file_obj:
-		csr_content = csr_file_obj.read()
-except (IOError, OSError) as csr_file_err:
-	# Log a comment and abort.
-	SubmitCSR.csr_uploader_logger.error('EXCEPTION_OCCURED::[CSR_FILE_ACCESS]::ABORTING::' + str(csr_file_err))
-	sys.exit(1)
-
-# Now handing over the charge to the Online CSR submission Process.
-# This process performs the task of uploading the software generated
-# CSR to the Certificate Authority via the portal.
-# Instantiate a CSR Submission Bot.
-csr_submission_bot = SubmitCSR.SubmitCSRToPortal()
-
-# Request the Certificate Details Page.
-# This is the initial page in the entire flow.
-csrf_token, details_resp_code = csr_submission_bot.get_cert_details(config.PortalConfig.URL_CERT_DETAILS_PAGE)
-
-# Check the response to fetching the Details Page.
-if details_resp_code == requests.codes.ok and not csr_submission_bot.failure:
-	# Imitate clicking on the Renew Option.
-	renew_url = config.PortalConfig.URL_RENEW_PAGE.format(csrf_token)
-	renew_resp_code = csr_submission_bot.select_renew_option(renew_url)
-else:
-	# Log a comment and abort.
-	SubmitCSR.csr_uploader_logger.error('Failed to Retrieve Details Page')
-	sys.exit(1)
-
-# Check for response to fetching the Renew Option.
-if renew_resp_code == requests.codes.ok and not csr_submission_bot.failure:
-	# Make a POST request to the enrollment page.
-	enroll_resp_code, san_list = csr_submission_bot.bypass_challenge_phrase(config.PortalConfig.URL_ENROLL_PAGE, csrf_token)
-else:
-	# Log a comment and abort.
-	SubmitCSR.csr_uploader_logger.error('Failed to Retrieve Renew Page')
-	sys.exit(1)
-
-# Check for response to retrieving the Certificate Enrollment Form.
-if enroll_resp_code == requests.codes.ok and not csr_submission_bot.failure:
-	# Make a Final POST request, posting the relevant information
-	# about the certificate.
+		# Log a comment and abort.
+		SubmitCSR.csr_uploader_logger.error('Failed to Retrieve Details Page')
+		return False
 
+	# Check for response to fetching the Renew Option.
+	if renew_resp_code == requests.codes.ok and not csr_submission_bot.failure:
+		# Make a POST request to the enrollment page.
+		with cert_audit.stage(config.AuditConfig.STAGE_ENROLL_PAGE):
+			enroll_resp_code, san_list = csr_submission_bot.bypass_challenge_phrase(cert_config.url_enroll_page, csrf_token)
+		cert_audit.record_response(config.AuditConfig.STAGE_ENROLL_PAGE, enroll_resp_code)
+	else:
+		# Log a comment and abort.
+		SubmitCSR.csr_uploader_logger.error('Failed to Retrieve Renew Page')
+		return False
+
+	# Check for response to retrieving the Certificate Enrollment Form.
+	if enroll_resp_code == requests.codes.ok and not csr_submission_bot.failure:
+		# Make a Final POST request, posting the relevant information
+		# about the certificate.
+
+		# Log a comment.
+		SubmitCSR.csr_uploader_logger.debug('Going Strong: Should Submit CSR now')
+
+		with cert_audit.stage(config.AuditConfig.STAGE_SUBMIT_PAGE):
+			csr_submit_resp_code = csr_submission_bot.submit_csr_details(cert_config.url_csr_submit_page, csr_content, csrf_token, san_list)
+		cert_audit.record_response(config.AuditConfig.STAGE_SUBMIT_PAGE, csr_submit_resp_code)
+	else:
+		# Log a comment and abort.
+		SubmitCSR.csr_uploader_logger.error('Failed to Retrieve Enrollment Page')
+		return False
+
+	# Check for the response to having successfully submitted the CSR.
+	if csr_submit_resp_code == requests.codes.ok and not csr_submission_bot.failure:
+		# Log a Successful Process Completion Entry.
+		SubmitCSR.csr_uploader_logger.info('CSR Submission Procedure Successfully Completed')
+		return True
 	# Log a comment.
-	SubmitCSR.csr_uploader_logger.debug('Going Strong: Should Submit CSR now')
-
-	csr_submit_resp_code = csr_submission_bot.submit_csr_details(config.PortalConfig.URL_CSR_SUBMIT_PAGE, csr_content, csrf_token, san_list)
-else:
-	# Log a comment and abort.
-	SubmitCSR.csr_uploader_logger.error('Failed to Retrieve Enrollment Page')
-	sys.exit(1)
-
-# Check for the response to having successfully submitted the CSR.
-if csr_submit_resp_code == requests.codes.ok and not csr_submission_bot.failure:
-	# Log a Successful Process Completion Entry.
-	SubmitCSR.csr_uploader_logger.info('CSR Submission Procedure Successfully Completed')
-else:
-	# Log a comment.
-	# Also Abort.
 	SubmitCSR.csr_uploader_logger.error('CSR Submission Process Failed. Check Log File Traceback')
-	sys.exit(1)
+	return False
+
+def main(argv=None):
+	'''
+	   Entry point. Without any option, a single certificate is renewed
+	   based on the defaults file (and the environment overrides). With
+	   the `--inventory` option, every row of the inventory is renewed
+	   within this very process. The inventory is streamed, and at most
+	   `--workers` certificates are worked upon at the same time, so the
+	   memory footprint does not grow with the size of the inventory.
+	   The whole batch goes through the Pre-Flight check first, nothing
+	   is generated or submitted if any certificate fails it.
+	   With `--profile`, the stages of every certificate are sampled, and
+	   the run's flame graph stacks and hotspots are written per stage.
+	'''
+	arg_parser = argparse.ArgumentParser(description='Automated Certificate Renewal.')
+	arg_parser.add_argument('--inventory', metavar='CSV_FILE',
+							help='CSV inventory, one certificate per row (header row holds the field names).')
+	arg_parser.add_argument('--pre-flight-only', action='store_true',
+							help='Only run the Pre-Flight check on the batch, then exit.')
+	arg_parser.add_argument('--workers', type=int, default=1,
+							help='Number of certificates renewed concurrently (default: 1).')
+	arg_parser.add_argument('--audit-store', metavar='JSONL_FILE', default=None,
+							help='The Audit Store to append the run to (default: see config/AuditConfig).')
+	arg_parser.add_argument('--profile', metavar='DIRECTORY', nargs='?', const=config.ProfileConfig.PROFILE_OUTPUT_LOCATION,
+							help='Profile the stages, and write the collapsed stacks and hotspots of the run into '
+								 'DIRECTORY/<run id>/ (default: see config/ProfileConfig).')
+	args = arg_parser.parse_args(argv)
+
+	def inventory_rows():
+		if args.inventory:
+			return CertificateConfig.read_inventory(args.inventory)
+		# No inventory, the defaults file describes the only certificate.
+		return [None]
+
+	# Every run, and every certificate of it, is recorded into the Audit
+	# Store. A batch rejected by the Pre-Flight check included.
+	stage_profiler = StageProfiler.StageProfiler() if args.profile else None
+	renewal_run = AuditTrail.RenewalRun(AuditTrail.AuditStore(args.audit_store), stage_profiler)
+
+	# Fail fast, before any expensive work is done.
+	pre_flight_failures = PreFlightCheck.run_pre_flight(inventory_rows(), max(args.workers, PreFlightCheck.DEFAULT_MAX_WORKERS))
+	if pre_flight_failures:
+		SubmitCSR.csr_uploader_logger.error('Pre-Flight Check Failed. Aborting the batch, nothing was submitted.')
+		for app_name, problems in pre_flight_failures:
+			# The problems shared by the batch are kept on the run record only.
+			if app_name != PreFlightCheck.SHARED_APP_NAME:
+				cert_audit = renewal_run.certificate(app_name)
+				cert_audit.current_stage = config.AuditConfig.STAGE_PRE_FLIGHT
+				cert_audit.finish(False)
+		renewal_run.finish(config.AuditConfig.RUN_OUTCOME_PRE_FLIGHT_FAILED, pre_flight_failures)
+		return 1
+	if args.pre_flight_only:
+		return 0
+
+	# One instance per signing backend, for the whole run.
+	signing_backends = {}
+
+	def renew_inventory_row(inventory_row):
+		# Only the row and its (slots based) CertificateConfig are alive
+		# for a certificate, until it is done with.
+		try:
+			cert_config = CertificateConfig.build_certificate_config(inventory_row)
+			# More SANs than the CA allows per certificate are split over
+			# several certificates.
+			part_configs = SANEngine.partition_certificate(cert_config)
+		except CertificateConfig.ConfigValidationError as config_err:
+			# Log a comment and move on to the next certificate.
+			SubmitCSR.csr_uploader_logger.error('EXCEPTION_OCCURED::[CONFIG_VALIDATION]::SKIPPING::' + str(config_err))
+			app_name = config_err.app_name
+		except Exception as config_err:
+			# A malformed row must not take the rest of the batch down.
+			SubmitCSR.csr_uploader_logger.exception('EXCEPTION_OCCURED::[CONFIG]::SKIPPING::' + str(config_err))
+			app_name = (inventory_row or {}).get('app_name')
+		else:
+			# Every part is renewed, even if an earlier one fails. A SAN
+			# moved to another part is still renewed.
+			renewed_sans = frozenset(name for part_config in part_configs for name in SANEngine.build_san_set(part_config).names) \
+						   if len(part_configs) > 1 else None
+			return all([renew_certificate(part_config, signing_backends, renewal_run, renewed_sans) for part_config in part_configs])
+		# Still recorded, the run's totals cover every certificate.
+		cert_audit = renewal_run.certificate(app_name)
+		cert_audit.current_stage = config.AuditConfig.STAGE_CONFIG
+		cert_audit.finish(False)
+		return False
+
+	failed_count = 0
+	if stage_profiler:
+		stage_profiler.start()
+	try:
+		for succeeded in BatchUtility.bounded_map(renew_inventory_row, inventory_rows(), max(args.workers, 1)):
+			if not succeeded:
+				failed_count += 1
+	finally:
+		renewal_run.finish()
+		for signing_backend in signing_backends.values():
+			signing_backend.close()
+		if stage_profiler:
+			stage_profiler.stop()
+			profile_directory = os.path.join(args.profile, renewal_run.run_id)
+			stage_profiler.write_profile(profile_directory)
+			SubmitCSR.csr_uploader_logger.info('Profile of the run written to ' + profile_directory)
+	return 1 if failed_count else 0
+
+if __name__ == '__main__':
+	sys.exit(main())
@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+
+'''
+   This module holds the Subject Alternative Names (SAN) engine. The SANs of
+   a certificate are its Common Name followed by its `san_list`. The engine,
+   ***********************************************************************
+   * Normalizes -> Strips, IDNA encodes, lower cases and drops the        *
+   *               trailing dot of each name.                             *
+   * Dedupes    -> Keeps the first occurrence of each name.               *
+   * Covers     -> Drops the names a wildcard of the set already covers.  *
+   * Partitions -> Splits a set over the CA's per certificate SAN limit   *
+   *               into several certificates, a name is then only dropped *
+   *               if a wildcard of its own certificate covers it.        *
+   ***********************************************************************
+   Every step is a single pass over the names, so sets of thousands of
+   names are handled in linear time. The CSR's SAN extension and the
+   portal's SAN field are both rendered from the resulting SANSet.
+'''
+
+##################################################################
+# Module Import Section.
+# Make all the necessary imports within this section.
+# Don't Pollute the entire file, with imports here and there.
+##################################################################
+
+# Used for the SAN syntax validation.
+import re
+# Used for keeping the order of the names within a partition.
+import collections
+
+import CertificateConfig
+import config.CSRConfig
+import config.SANConfig
+
+##################################################################
+
+# A DNS name, optionally with a leading wildcard label.
+SAN_PATTERN = re.compile(r'^(\*\.)?([a-z0-9]([a-z0-9-]{0,61}[a-z0-9])?\.)*[a-z0-9]([a-z0-9-]{0,61}[a-z0-9])?$', re.IGNORECASE)
+# The longest DNS name.
+MAX_SAN_LENGTH = 253
+
+WILDCARD_PREFIX = '*.'
+
+def normalize_san(raw_name):
+	'''
+	   Return the normalized form of a single name, `''` for an empty one.
+	   Raises ValueError for a name which cannot be IDNA encoded.
+	'''
+	name = raw_name.strip()
+	if name.endswith('.'):
+		name = name[:-1]
+	try:
+		name.encode('ascii')
+	except UnicodeEncodeError:
+		# Internationalized name, the certificate holds its `xn--` form.
+		name = name.encode('idna').decode('ascii')
+	return name.lower()
+
+class SANSet(object):
+	'''
+	   The normalized, deduplicated SANs of one certificate. The *pinned_name*
+	   (the Common Name) is always kept, and always first.
+	   Besides the `names`, the names dropped along the way are kept for
+	   reporting: `duplicates`, `covered` (`(name, wildcard)` tuples) and
+	   `invalid`. The `unique_names` are the valid names before coverage,
+	   which is computed per certificate when the set is partitioned.
+	'''
+
+	__slots__ = ('names', 'unique_names', 'exempt_name', 'duplicates', 'covered', 'invalid',)
+
+	def __init__(self, raw_names, pinned_name=None):
+		self.duplicates = []
+		self.covered    = []
+		self.invalid    = []
+
+		seen_names = set()
+		unique_names = self.unique_names = []
+		wildcard_domains = set()
+		exempt_name = self.exempt_name = None
+		for position, raw_name in enumerate(([pinned_name] if pinned_name else []) + list(raw_names)):
+			try:
+				name = normalize_san(raw_name)
+			except UnicodeError:
+				self.invalid.append(raw_name)
+				continue
+			if not name:
+				continue
+			if len(name) > MAX_SAN_LENGTH or not SAN_PATTERN.match(name):
+				self.invalid.append(raw_name)
+				continue
+			if name in seen_names:
+				self.duplicates.append(raw_name)
+				continue
+			seen_names.add(name)
+			unique_names.append(name)
+			if pinned_name and position == 0:
+				exempt_name = self.exempt_name = name
+			if name.startswith(WILDCARD_PREFIX):
+				wildcard_domains.add(name[len(WILDCARD_PREFIX):])
+
+		# A wildcard covers exactly one label, `*.example.com` covers
+		# `www.example.com` but neither `example.com` nor `a.b.example.com`.
+		self.names = []
+		for name in unique_names:
+			parent_domain = name.partition('.')[2]
+			if name == exempt_name or name.startswith(WILDCARD_PREFIX) or parent_domain not in wildcard_domains:
+				self.names.append(name)
+			else:
+				self.covered.append((name, WILDCARD_PREFIX + parent_domain))
+
+	def __len__(self):
+		return len(self.names)
+
+	def partition(self, max_sans=None):
+		'''
+		   Split the names into consecutive lists of at most *max_sans*
+		   names. The pinned name stays at the head of the first list.
+		   Each list is a certificate of its own, so a name is only left
+		   out if a wildcard of the same list covers it: the unique names
+		   are filled in order, and a wildcard joining a list removes the
+		   names it covers from that list.
+		'''
+		max_sans = max_sans or config.SANConfig.MAX_SANS_PER_CERTIFICATE
+		if len(self.names) <= max_sans:
+			# A single certificate, the coverage of the whole set holds.
+			return [self.names] if self.names else []
+
+		san_parts = []
+		# Keeps the insertion order, and drops a name in O(1).
+		part_names = collections.OrderedDict()
+		part_names_by_domain = {}
+		part_wildcard_domains = set()
+		for name in self.unique_names:
+			parent_domain = name.partition('.')[2]
+			is_wildcard = name.startswith(WILDCARD_PREFIX)
+			if not is_wildcard and name != self.exempt_name and parent_domain in part_wildcard_domains:
+				continue
+			if len(part_names) == max_sans:
+				san_parts.append(list(part_names))
+				part_names = collections.OrderedDict()
+				part_names_by_domain = {}
+				part_wildcard_domains = set()
+			part_names[name] = None
+			if is_wildcard:
+				wildcard_domain = name[len(WILDCARD_PREFIX):]
+				part_wildcard_domains.add(wildcard_domain)
+				for covered_name in part_names_by_domain.pop(wildcard_domain, ()):
+					del part_names[covered_name]
+			elif name != self.exempt_name:
+				part_names_by_domain.setdefault(parent_domain, []).append(name)
+		san_parts.append(list(part_names))
+		return san_parts
+
+	def openssl_extension(self):
+		'''
+		   The value of the OpenSSL Tool's `-addext` option.
+		'''
+		return 'subjectAltName=' + ','.join('DNS:' + name for name in self.names)
+
+	def portal_field(self):
+		'''
+		   The value of the portal's SAN form field.
+		'''
+		return config.SANConfig.PORTAL_SAN_SEPERATOR.join(self.names)
+
+def dropped_sans(current_names, renewed_names):
+	'''
+	   The names of *current_names* (normalized) which are neither in
+	   *renewed_names* nor covered by one of its wildcards.
+	'''
+	renewed_names = set(renewed_names)
+	return [name for name in current_names
+			if name not in renewed_names and WILDCARD_PREFIX + name.partition('.')[2] not in renewed_names]
+
+def build_san_set(cert_config):
+	'''
+	   The SANSet of a certificate: its Common Name, then its `san_list`.
+	'''
+	return SANSet(cert_config.san_list, pinned_name=cert_config.common_name)
+
+def partition_certificate(cert_config, max_sans=None):
+	'''
+	   Return the list of CertificateConfig objects the certificate has to
+	   be renewed as. That is the certificate itself, unless its SANs go
+	   over the CA's limit: the SANs are then split, the first part stays
+	   with the certificate, and each additional part renews the next
+	   certificate of its `part_issuer_serials`.
+	   Raises ConfigValidationError if there are not enough of those.
+	'''
+	san_parts = build_san_set(cert_config).partition(max_sans)
+	if len(san_parts) <= 1:
+		return [cert_config]
+	if len(cert_config.part_issuer_serials) < len(san_parts) - 1:
+		raise CertificateConfig.ConfigValidationError(cert_config.app_name, [
+			'{} SANs go over the limit of {} per certificate: {} certificates are needed, '
+			'field `part_issuer_serials` lists {} additional one(s)'.format(sum(len(san_part) for san_part in san_parts),
+																		   max_sans or config.SANConfig.MAX_SANS_PER_CERTIFICATE,
+																		   len(san_parts), len(cert_config.part_issuer_serials))])
+
+	part_configs = [cert_config.replace(san_list=san_parts[0][1:])]
+	for part_number, (san_part, issuer_serial) in enumerate(zip(san_parts[1:], cert_config.part_issuer_serials), 2):
+		# Each part is a certificate of its own: own name, key and CSR.
+		part_configs.append(cert_config.replace(app_name=config.SANConfig.PART_APP_NAME_TEMPLATE.format(app_name=cert_config.app_name,
+																									  part_number=part_number),
+												common_name=san_part[0],
+												san_list=san_part[1:],
+												issuer_serial=issuer_serial,
+												part_issuer_serials=(),
+												use_existing_csr=config.CSRConfig.VALUE_NOT_SET,
+												use_existing_pkey=config.CSRConfig.VALUE_NOT_SET,
+												pkcs11_key_label=''))
+	return part_configs
@@ -0,0 +1,378 @@
+#!/usr/bin/env python3
+
+'''
+   This module holds the CSR signing backend(s). A signing backend owns the
+   certificate's Private Key and signs the CSR with it.
+
+   SoftwareSigningBackend, the default (`software`) backend, is a wrapper
+   for the OpenSSL Tool. It generates the Private Key into the PKEY store
+   (or reuses the one present there) and has OpenSSL sign the CSR.
+
+   PKCS11SigningBackend generates the key pair inside a PKCS#11 token (an
+   HSM, or SoftHSM for local use) and has the token sign the CSR. The key
+   is created non-extractable and never touches the disk. The token is
+   logged into once per run, the open sessions are pooled and shared by
+   all the certificates (and threads) of the run.
+
+   Additional Modules required by the PKCS#11 backend only,
+        - python-pkcs11 (`pkcs11`)
+        - asn1crypto
+'''
+
+##################################################################
+# Module Import Section.
+# Make all the necessary imports within this section.
+# Don't Pollute the entire file, with imports here and there.
+##################################################################
+
+# Logging Module to enable this application to log its events.
+import logging
+# To help out with OS level interactions.
+import os
+# Used as the (thread safe) pool of token sessions.
+import queue
+# Used for guarding the lazy opening of the token.
+import threading
+# Used for scoping the checkout of a pooled session.
+import contextlib
+# Used for declaring the signing backend interface.
+import abc
+# Below module handles subprocesses and their interaction.
+import subprocess, io
+
+# The PKCS#11 backend depends on the below modules. They are only
+# required when that backend is actually used.
+try:
+	import pkcs11
+	import pkcs11.util.rsa
+	from asn1crypto import csr as asn1_csr, keys as asn1_keys, pem as asn1_pem, x509 as asn1_x509
+except ImportError:
+	pkcs11 = None
+
+import SANEngine
+import config.SigningConfig
+
+##################################################################
+
+##################################################################
+# Setting up the logger Instance.
+
+import LoggerUtility
+import config.LoggerConfig
+
+SIGNING_BACKEND_LOGGER_NAME = '.SigningBackend'
+
+# Instantiate the module level Logger object.
+signing_backend_logger = logging.getLogger(config.LoggerConfig.APP_LOGGER_NAME + SIGNING_BACKEND_LOGGER_NAME)
+
+##################################################################
+
+# Guards the creation of the shared backend instances.
+signing_backends_lock = threading.Lock()
+
+# Portal Signature Algorithm -> (PKCS#11 Mechanism name, ASN.1 algorithm name).
+SIGNATURE_ALGORITHMS = {
+						'sha256WithRSAEncryption': ('SHA256_RSA_PKCS', 'sha256_rsa'),
+						'sha384WithRSAEncryption': ('SHA384_RSA_PKCS', 'sha384_rsa'),
+						'sha512WithRSAEncryption': ('SHA512_RSA_PKCS', 'sha512_rsa'),
+					   }
+
+class SigningBackendError(Exception):
+	'''
+	   Raised when a signing backend cannot produce the CSR.
+	'''
+
+class SigningBackend(abc.ABC):
+	'''
+	   The interface every signing backend implements.
+	'''
+
+	@abc.abstractmethod
+	def generate_csr(self, cert_config):
+		'''
+		   Return the PEM encoded CSR of the certificate, signed by its
+		   Private Key. The key pair is generated first, if not present.
+		'''
+
+	def close(self):
+		'''
+		   Release whatever the backend holds on to.
+		'''
+
+class SoftwareSigningBackend(SigningBackend):
+	'''
+	   Keep the Private Key in the PKEY store and have the OpenSSL Tool
+	   generate and sign the CSR. The CSR is written to the CSR store by
+	   OpenSSL itself.
+	'''
+
+	@staticmethod
+	def existing_private_key(cert_config):
+		'''
+		   The Private Key to reuse: the configured existing one, else the
+		   one in the PKEY store. `None` if there is none.
+		'''
+		for candidate in (cert_config.use_existing_pkey, cert_config.private_key_name):
+			if candidate and os.path.isfile(candidate):
+				return candidate
+		return None
+
+	def generate_csr(self, cert_config):
+		# Check for the PRIVATE KEY output directory location.
+		# Other certificates of the batch may be creating it concurrently.
+		os.makedirs(cert_config.pkey_directory_location, exist_ok=True)
+
+		use_existing_pkey = self.existing_private_key(cert_config)
+		if use_existing_pkey:
+			# We only create a new CSR. We will be
+			# using the existing PKEY, when installing
+			# the `CERTIFICATE`.
+			signing_backend_logger.info('Generating CSR from Existing Private Key: %s', use_existing_pkey)
+			openssl_command = ['openssl', 'req', '-out', cert_config.csr_name,
+							   '-key', use_existing_pkey, '-new']
+		else:
+			# Generate a new CSR and PKEY pair.
+			signing_backend_logger.info('Generating CSR and Private Key.')
+			openssl_command = ['openssl', 'req', '-out', cert_config.csr_name,
+							   '-new', '-newkey', 'rsa:2048', '-nodes', '-keyout', cert_config.private_key_name]
+
+		# The SANs go into the CSR itself, the same list as the one
+		# submitted through the portal.
+		openssl_command += ['-addext', SANEngine.build_san_set(cert_config).openssl_extension()]
+
+		# Create a PIPED OpenSSL Sub-Process. The arguments are passed as
+		# is, no shell is involved: the file names come from the inventory.
+		try:
+			proc = subprocess.Popen(openssl_command,
+									stdin=subprocess.PIPE,
+									stdout=subprocess.PIPE,)
+		except OSError as openssl_err:
+			raise SigningBackendError('Unable to run the OpenSSL Tool: ' + str(openssl_err))
+
+		# Instantiate the STDIN stream for the PIPED Process.
+		stdin = io.TextIOWrapper(proc.stdin, encoding='utf-8',
+								 line_buffering=True,)
+
+		# Output Start Marker.
+		print('\n********************** SUBPROCESS OUTPUT *********************\n')
+
+		# Start sending the certificate information to the subprocess
+		# prompt, one answer per line.
+		for info in cert_config.csr_info:
+			info_line = '{}\n'.format(info)
+			# Write the data to the OpenSSL process.
+			stdin.write(info_line)
+
+			# Log a comment
+			signing_backend_logger.debug('Passing in value: %s', info_line)
+
+		# Get the remaining output from the child process and
+		# display it on screen.
+		remaining_proc_out = proc.communicate()[0].decode('utf-8')
+		print(remaining_proc_out)
+
+		# Output End Marker.
+		print('\n********************** SUBPROCESS OUTPUT *********************\n')
+
+		if proc.returncode:
+			raise SigningBackendError('OpenSSL failed to generate the CSR {} (exit status {})'.format(cert_config.csr_name, proc.returncode))
+		try:
+			with open(cert_config.csr_name, 'r') as csr_file_obj:
+				return csr_file_obj.read()
+		except (IOError, OSError) as csr_file_err:
+			raise SigningBackendError('Unable to read the generated CSR: ' + str(csr_file_err))
+
+class PKCS11SessionPool(object):
+	'''
+	   A fixed size pool of open, logged in, sessions on a PKCS#11 token.
+	   The token is opened lazily, on the first checkout, so that building
+	   the pool costs nothing when no certificate uses it.
+	'''
+
+	def __init__(self, module_path, token_label, user_pin, pool_size):
+		self.module_path = module_path
+		self.token_label = token_label
+		self.user_pin    = user_pin
+		self.pool_size   = pool_size
+		self.sessions    = []
+		self.idle        = queue.Queue()
+		self.lock        = threading.Lock()
+
+	def _open(self):
+		'''
+		   Load the PKCS#11 module and open all the sessions. The login
+		   state is shared by all the sessions of this process, so only
+		   the first session logs in.
+		'''
+		if pkcs11 is None:
+			raise SigningBackendError('The PKCS#11 signing backend requires the `python-pkcs11` and `asn1crypto` modules.')
+		if not self.user_pin:
+			raise SigningBackendError('PKCS#11 User PIN is not set, export ' + config.SigningConfig.PKCS11_USER_PIN_ENV)
+		try:
+			token = pkcs11.lib(self.module_path).get_token(token_label=self.token_label)
+			for session_number in range(self.pool_size):
+				if session_number == 0:
+					session = token.open(rw=True, user_pin=self.user_pin)
+				else:
+					session = token.open(rw=True)
+				self.sessions.append(session)
+				self.idle.put(session)
+		except (OSError, RuntimeError, pkcs11.PKCS11Error) as token_err:
+			self._close_sessions()
+			raise SigningBackendError('Unable to open PKCS#11 token {!r}: {!r}'.format(self.token_label, token_err))
+		# Log a comment.
+		signing_backend_logger.info('PKCS#11 token %s opened, %s session(s) pooled.', self.token_label, self.pool_size)
+
+	@contextlib.contextmanager
+	def session(self):
+		'''
+		   Check a session out of the pool, for the duration of the `with`
+		   block. Blocks while all the sessions are busy.
+		'''
+		with self.lock:
+			if not self.sessions:
+				self._open()
+		session = self.idle.get()
+		try:
+			yield session
+		finally:
+			self.idle.put(session)
+
+	def _close_sessions(self):
+		# The session holding the login is closed last.
+		while self.sessions:
+			self.sessions.pop().close()
+		self.idle = queue.Queue()
+
+	def close(self):
+		'''
+		   Close all the sessions. The pool can still be used afterwards,
+		   the token is then opened again.
+		'''
+		with self.lock:
+			self._close_sessions()
+
+class PKCS11SigningBackend(SigningBackend):
+	'''
+	   Keep the Private Key within a PKCS#11 token and sign the CSR there.
+	'''
+
+	def __init__(self, module_path=None, token_label=None, user_pin=None, pool_size=None):
+		self.session_pool = PKCS11SessionPool(module_path or config.SigningConfig.PKCS11_MODULE,
+											  token_label or config.SigningConfig.PKCS11_TOKEN_LABEL,
+											  user_pin or os.environ.get(config.SigningConfig.PKCS11_USER_PIN_ENV),
+											  pool_size or config.SigningConfig.PKCS11_SESSION_POOL_SIZE)
+
+	@staticmethod
+	def _find_key(session, object_class, key_label):
+		'''
+		   Return the key with the given label, or `None`.
+		'''
+		try:
+			return session.get_key(object_class=object_class, key_type=pkcs11.KeyType.RSA, label=key_label)
+		except pkcs11.NoSuchKey:
+			return None
+
+	def _get_or_generate_keypair(self, session, cert_config):
+		public_key  = self._find_key(session, pkcs11.ObjectClass.PUBLIC_KEY, cert_config.key_label)
+		private_key = self._find_key(session, pkcs11.ObjectClass.PRIVATE_KEY, cert_config.key_label)
+		if public_key is not None and private_key is not None:
+			signing_backend_logger.info('Using Existing Private Key from PKCS#11 token: %s', cert_config.key_label)
+			return public_key, private_key
+		signing_backend_logger.info('Generating Private Key within PKCS#11 token: %s', cert_config.key_label)
+		return session.generate_keypair(pkcs11.KeyType.RSA, config.SigningConfig.PKCS11_RSA_KEY_SIZE,
+										label=cert_config.key_label, store=True,
+										private_template={pkcs11.Attribute.SENSITIVE  : True,
+														  pkcs11.Attribute.EXTRACTABLE: False,})
+
+	def generate_csr(self, cert_config):
+		if cert_config.signature_algorithm not in SIGNATURE_ALGORITHMS:
+			raise SigningBackendError('Unsupported signature algorithm: ' + cert_config.signature_algorithm)
+		mechanism_name, asn1_algorithm = SIGNATURE_ALGORITHMS[cert_config.signature_algorithm]
+
+		subject = {
+				   'country_name'            : cert_config.country,
+				   'state_or_province_name'  : cert_config.state,
+				   'locality_name'           : cert_config.locality,
+				   'organization_name'       : cert_config.organization,
+				   'organizational_unit_name': cert_config.organizational_unit,
+				   'common_name'             : cert_config.common_name,
+				   'email_address'           : cert_config.email_address,
+				  }
+		# The SANs go into the CSR, the same list as the one submitted
+		# through the portal.
+		san_set = SANEngine.build_san_set(cert_config)
+		try:
+			with self.session_pool.session() as session:
+				public_key, private_key = self._get_or_generate_keypair(session, cert_config)
+				csr_info = asn1_csr.CertificationRequestInfo({
+					'version'        : 'v1',
+					'subject'        : asn1_x509.Name.build(dict((name, value) for name, value in subject.items() if value)),
+					'subject_pk_info': {
+										'algorithm' : {'algorithm': 'rsa', 'parameters': None},
+										'public_key': asn1_keys.RSAPublicKey.load(pkcs11.util.rsa.encode_rsa_public_key(public_key)),
+									   },
+					'attributes'     : [{
+										 'type'  : 'extension_request',
+										 'values': [[{
+													  'extn_id'   : 'subject_alt_name',
+													  'critical'  : False,
+													  'extn_value': [asn1_x509.GeneralName(name='dns_name', value=name) for name in san_set.names],
+													}]],
+										}],
+				})
+				signature = private_key.sign(csr_info.dump(), mechanism=getattr(pkcs11.Mechanism, mechanism_name))
+		except pkcs11.PKCS11Error as token_err:
+			raise SigningBackendError('PKCS#11 signing failed for {}: {!r}'.format(cert_config.key_label, token_err))
+
+		csr = asn1_csr.CertificationRequest({
+			'certification_request_info': csr_info,
+			'signature_algorithm'       : {'algorithm': asn1_algorithm, 'parameters': None},
+			'signature'                 : signature,
+		})
+		return asn1_pem.armor('CERTIFICATE REQUEST', csr.dump()).decode('ascii')
+
+	def close(self):
+		self.session_pool.close()
+
+def get_signing_backend(signing_backend_name, backends):
+	'''
+	   Return the backend instance to use for *signing_backend_name*,
+	   creating it on first use. The *backends* dictionary caches the
+	   instances, so that one run shares a single token login and session
+	   pool across all of its certificates.
+	'''
+	with signing_backends_lock:
+		if signing_backend_name not in backends:
+			if signing_backend_name == config.SigningConfig.SIGNING_BACKEND_SOFTWARE:
+				backends[signing_backend_name] = SoftwareSigningBackend()
+			elif signing_backend_name == config.SigningConfig.SIGNING_BACKEND_PKCS11:
+				backends[signing_backend_name] = PKCS11SigningBackend()
+			else:
+				raise SigningBackendError('Unknown signing backend: ' + signing_backend_name)
+		return backends[signing_backend_name]
+
+# Execute Module Code.
+# Sign a handful of CSRs concurrently against the configured token, as a
+# smoke check of the token setup (e.g. a freshly initialized SoftHSM).
+if __name__ == '__main__':
+	import concurrent.futures
+	import sys
+	import CertificateConfig
+
+	smoke_backend = PKCS11SigningBackend()
+	# The portal identifiers are never used, any well formed value does.
+	smoke_configs = [CertificateConfig.build_certificate_config({'app_name': 'smoke{}.example.com'.format(number),
+																 'issuer_serial': '{:032X}'.format(number),
+																 'jur_hash': 'F' * 32,
+																 'signing_backend': config.SigningConfig.SIGNING_BACKEND_PKCS11})
+					 for number in range(config.SigningConfig.PKCS11_SESSION_POOL_SIZE * 2)]
+	try:
+		with concurrent.futures.ThreadPoolExecutor(max_workers=config.SigningConfig.PKCS11_SESSION_POOL_SIZE) as executor:
+			for smoke_config, csr_pem in zip(smoke_configs, executor.map(smoke_backend.generate_csr, smoke_configs)):
+				signing_backend_logger.info('Signed CSR for %s (%s bytes).', smoke_config.app_name, len(csr_pem))
+	except SigningBackendError as signing_err:
+		signing_backend_logger.error('EXCEPTION_OCCURED::[PKCS11_SMOKE]::ABORTING::' + str(signing_err))
+		sys.exit(1)
+	finally:
+		smoke_backend.close()
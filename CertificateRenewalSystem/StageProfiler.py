@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+
+'''
+   This module holds the Stage Profiler, used by the `--profile` mode of
+   the renewal entry point. It is a sampling profiler: a background thread
+   takes the stack of every thread busy with a renewal stage (CSR
+   generation, the portal pages), at a fixed interval. Samples are
+   aggregated per stage, for all the certificates of the run, into,
+   ***********************************************************************
+   * Collapsed stacks -> `stage;frame;frame;... count`, flame graph ready *
+   *                     (flamegraph.pl, speedscope, ...).                *
+   * Hotspots table   -> Per stage, the top functions by samples.         *
+   ***********************************************************************
+   As the profile is of the wall clock time, time spent waiting on the
+   network or on the OpenSSL Tool shows up, as well as the CPU time of
+   the parsing and the logging.
+
+   Nothing is profiled unless a profiler is handed to the RenewalRun;
+   the stage hooks then cost a single attribute check.
+'''
+
+##################################################################
+# Module Import Section.
+# Make all the necessary imports within this section.
+# Don't Pollute the entire file, with imports here and there.
+##################################################################
+
+# Used for keeping the sample counts.
+import collections
+# To help out with OS level interactions.
+import os
+# Used for taking the threads' stacks.
+import sys
+# The sampler runs in its own thread.
+import threading
+
+import config.ProfileConfig
+
+##################################################################
+
+class StageProfiler(object):
+	'''
+	   Sample the stacks of the threads running a stage, between the
+	   `start()` and the `stop()` calls.
+	'''
+
+	def __init__(self, sample_interval=None, max_stack_depth=None):
+		self.sample_interval = sample_interval or config.ProfileConfig.SAMPLE_INTERVAL_SECONDS
+		self.max_stack_depth = max_stack_depth or config.ProfileConfig.MAX_STACK_DEPTH
+		# Thread identifier -> (stage name, frame the stage was entered from).
+		# Updated by the renewal threads, read by the sampler.
+		self.active_stages   = {}
+		# (stage name, frame label, ...) -> number of samples.
+		self.stack_samples   = collections.Counter()
+		self.sample_count    = 0
+		self.frame_labels    = {}
+		self.stop_event      = threading.Event()
+		self.sampler_thread  = None
+
+	def enter_stage(self, stage_name, entry_frame):
+		'''
+		   The calling thread starts running *stage_name*. Its stacks are
+		   recorded from *entry_frame* (the one holding the `with` block)
+		   inwards.
+		'''
+		self.active_stages[threading.get_ident()] = (stage_name, entry_frame)
+
+	def exit_stage(self):
+		self.active_stages.pop(threading.get_ident(), None)
+
+	def start(self):
+		self.sampler_thread = threading.Thread(target=self._sample_forever, name='StageProfiler')
+		self.sampler_thread.daemon = True
+		self.sampler_thread.start()
+
+	def stop(self):
+		self.stop_event.set()
+		if self.sampler_thread:
+			self.sampler_thread.join()
+
+	def _sample_forever(self):
+		while not self.stop_event.wait(self.sample_interval):
+			self.sample()
+
+	def _frame_label(self, code):
+		frame_label = self.frame_labels.get(code)
+		if frame_label is None:
+			# Keep the package directory, so `bs4/__init__.py` does not read
+			# as any other `__init__.py`. Semicolons separate the frames.
+			file_name = os.path.join(os.path.basename(os.path.dirname(code.co_filename)), os.path.basename(code.co_filename))
+			frame_label = '{} ({}:{})'.format(code.co_name, file_name, code.co_firstlineno).replace(';', ':')
+			self.frame_labels[code] = frame_label
+		return frame_label
+
+	def sample(self):
+		'''
+		   Take a single sample of all the threads running a stage.
+		'''
+		thread_frames = sys._current_frames()
+		for thread_ident, (stage_name, entry_frame) in self.active_stages.copy().items():
+			frame = thread_frames.get(thread_ident)
+			stack = []
+			while frame is not None and len(stack) < self.max_stack_depth:
+				stack.append(self._frame_label(frame.f_code))
+				if frame is entry_frame:
+					break
+				frame = frame.f_back
+			if stack:
+				stack.append(stage_name)
+				stack.reverse()
+				self.stack_samples[tuple(stack)] += 1
+		self.sample_count += 1
+
+	#****************************** OUTPUT *******************************
+
+	def stages(self):
+		return sorted(set(stack[0] for stack in self.stack_samples))
+
+	def collapsed_stacks(self, stage_name=None):
+		'''
+		   Generator yielding the `frame;frame;... count` lines, for all the
+		   stages or for *stage_name* only.
+		'''
+		for stack, samples in sorted(self.stack_samples.items()):
+			if stage_name is None or stack[0] == stage_name:
+				yield '{} {}\n'.format(';'.join(stack), samples)
+
+	def hotspots(self, stage_name, top_n=None):
+		'''
+		   The stage's top functions, by self samples. Returns the stage's
+		   sample count and a list of `(self, total, frame label)` tuples;
+		   *total* counts the samples the function is on the stack for.
+		'''
+		stage_samples  = 0
+		self_samples   = collections.Counter()
+		total_samples  = collections.Counter()
+		for stack, samples in self.stack_samples.items():
+			if stack[0] != stage_name:
+				continue
+			stage_samples += samples
+			self_samples[stack[-1]] += samples
+			# Recursive functions are counted once per sample.
+			for frame_label in set(stack[1:]):
+				total_samples[frame_label] += samples
+		return stage_samples, [(samples, total_samples[frame_label], frame_label)
+							   for frame_label, samples in self_samples.most_common(top_n or config.ProfileConfig.PROFILE_TOP_N)]
+
+	def render_hotspots(self, top_n=None):
+		lines = ['Samples taken every {:.1f}ms ({} samples). A sample is one thread in a stage.\n'.format(self.sample_interval * 1000, self.sample_count)]
+		for stage_name in self.stages():
+			stage_samples, stage_hotspots = self.hotspots(stage_name, top_n)
+			lines.append('\n{} : {} samples (~{:.2f}s of thread time)\n'.format(stage_name, stage_samples, stage_samples * self.sample_interval))
+			lines.append('  {:>8} {:>6} {:>8} {:>6}  {}\n'.format('Self', 'Self%', 'Total', 'Total%', 'Function'))
+			for self_count, total_count, frame_label in stage_hotspots:
+				lines.append('  {:>8} {:>5.1f}% {:>8} {:>5.1f}%  {}\n'.format(self_count, 100.0 * self_count / stage_samples,
+																			   total_count, 100.0 * total_count / stage_samples, frame_label))
+		return ''.join(lines)
+
+	def write_profile(self, output_directory, top_n=None):
+		'''
+		   Write the collapsed stacks (all stages, then one file per stage)
+		   and the hotspots table into *output_directory*.
+		'''
+		if not os.path.exists(output_directory):
+			os.makedirs(output_directory)
+		with open(os.path.join(output_directory, config.ProfileConfig.COLLAPSED_STACKS_FILENAME), 'w') as collapsed_file_obj:
+			collapsed_file_obj.writelines(self.collapsed_stacks())
+		for stage_name in self.stages():
+			with open(os.path.join(output_directory, config.ProfileConfig.STAGE_COLLAPSED_FILENAME.format(stage=stage_name)), 'w') as collapsed_file_obj:
+				collapsed_file_obj.writelines(self.collapsed_stacks(stage_name))
+		with open(os.path.join(output_directory, config.ProfileConfig.HOTSPOTS_FILENAME), 'w') as hotspots_file_obj:
+			hotspots_file_obj.write(self.render_hotspots(top_n))
@@ -15,8 +15,9 @@ import logging
 import RequestUtility
 import config.PortalConfig
 import sys
-import config.CSRConfig
-from bs4 import BeautifulSoup
+import CertificateConfig
+import SANEngine
+from bs4 import BeautifulSoup, SoupStrainer
 
 # To be used when performing time manipulation operations.
 import time
@@ -27,6 +28,9 @@ import getpass
 # Below module captures the system information.
 import platform
 
+# Used for reading the Service Agreement notes only once per process.
+import functools
+
 #########################################################################
 
 #########################################################################
@@ -42,6 +46,18 @@ csr_uploader_logger = logging.getLogger(config.LoggerConfig.APP_LOGGER_NAME + UP
 
 #########################################################################
 
+# Restricts the Enrollment page parse tree to the `SAN` entity.
+SAN_STRAINER = SoupStrainer('textarea', id='subject_alt_names')
+
+@functools.lru_cache(maxsize=None)
+def read_service_agreement_notes(agreement_file_name):
+	'''
+	   The Service Agreement notes are the same for every certificate,
+	   read them once and share them across the whole batch.
+	'''
+	with open(agreement_file_name, 'r') as agreement_file_obj:
+		return agreement_file_obj.read()
+
 # Below is the class definition that makes the CSR submission
 # for the desired certificate renewal procedure.
 class SubmitCSRToPortal(object):
@@ -49,12 +65,19 @@ class SubmitCSRToPortal(object):
 	   The Class Definition which performs the Automated Online CSR Submission.
 	'''
 
-	def __init__(self):
+	def __init__(self, cert_config, renewed_sans=None):
 		'''
 		   Capture environment information and other relevant information
 		   for auditing purposes. These information must be captured before
 		   the CSR submision.
+		   The *cert_config* parameter is the (already validated)
+		   CertificateConfig object of the certificate to submit.
+		   The *renewed_sans* parameter, if passed, holds the SANs renewed
+		   by all the parts of a partitioned certificate (see `SANEngine.py`),
+		   the certificate's own SANs otherwise.
 		'''
+		self.cert_config          = cert_config
+		self.renewed_sans         = renewed_sans
 		self.time                 = time.ctime()
 		self.user                 = getpass.getuser()
 		self.host                 = platform.node()
@@ -64,7 +87,7 @@ class SubmitCSRToPortal(object):
 		# Execution Status Flag.
 		self.failure              = False
 		# Log a comment.
-		csr_uploader_logger.info('[Time: %s, User: %s, Host: %s, OS_INFO: %s]', self.time, self.user, self.host, self.os_info)
+		csr_uploader_logger.info('[Time: %s, User: %s, Host: %s, OS_INFO: %s, APP_NAME: %s]', self.time, self.user, self.host, self.os_info, self.cert_config.app_name)
 
 	def get_cert_details(self, url_cert_details_page):
 		'''
@@ -139,19 +162,29 @@ class SubmitCSRToPortal(object):
 				csr_uploader_logger.info('Response Code [ENROLL_PAGE]: %s', resp_enroll_page.status_code)
 				
 				# Below logging statement should not be run in production.
-				csr_uploader_logger.debug(str(resp_enroll_page.text))
+				# The page is only decoded if the DEBUG level is enabled.
+				if csr_uploader_logger.isEnabledFor(logging.DEBUG):
+					csr_uploader_logger.debug('%s', resp_enroll_page.text)
 				
 				# Also in the process, check the enrollment page if any Subject
 				# Alternative Name (SAN) already exists.
 				CURRENT_SAN_SEPERATOR = ','
-				souped_up_enrollment = BeautifulSoup(resp_enroll_page.text, 'html.parser')
+				# Only the `SAN` entity is kept in the parse tree, the rest of
+				# the page is skipped while parsing.
+				souped_up_enrollment = BeautifulSoup(resp_enroll_page.text, 'html.parser', parse_only=SAN_STRAINER)
 				# Gather the `TEXTAREA` tags, based on the `ID` value supplied.
 				# Should return one entity only, as `ID` attribute is used.
 				# Get the `SAN` text present within the previously parsed HTML
 				# entity.
-				san_names = souped_up_enrollment.select('#subject_alt_names')[0].string
+				# An empty (or missing) `TEXTAREA` means no SAN exists yet.
+				san_elements = souped_up_enrollment.select('#subject_alt_names')
+				san_names = san_elements[0].get_text() if san_elements else ''
 				# The `TEXT` is comma seperated, hence we need to split it based on tha
-				san_list = san_names.split(CURRENT_SAN_SEPERATOR)
+				san_list = [san_name for san_name in san_names.split(CURRENT_SAN_SEPERATOR) if san_name.strip()]
+				# The parse tree is self referencing, tear it down now
+				# rather than leaving it for the garbage collector.
+				souped_up_enrollment.decompose()
+				del souped_up_enrollment
 
 				# Log a comment.
 				csr_uploader_logger.debug('SAN Values [Enrollment Page]: ' + str(san_list))
@@ -159,11 +192,14 @@ class SubmitCSRToPortal(object):
 				# Log a comment stating the returned Response code.
 				csr_uploader_logger.error('Response Code [ENROLL_PAGE]: %s', resp_enroll_page.status_code)
 				self.failure = True
+				san_list = []
 			return resp_enroll_page.status_code, san_list
 		except requests.exceptions.RequestException as request_err:
 			# Log Error and turn on evasive mode.
 			csr_uploader_logger.critical('EXCEPTION_OCCURED::[ENROLL_PAGE]::ABORTING::' + str(request_err))
 			self.failure = True
+			# The caller expects a Tuple, see `get_cert_details`.
+			return (None, [])
 
 	def submit_csr_details(self, url_csr_submit_page, csr_content, csrf_token, san_list):
 		'''
@@ -172,23 +208,33 @@ class SubmitCSRToPortal(object):
 		'''
 		# Prepare the POST payload.
 		# Getting the Service Agreement Notes
-		AGREEMENT_FILE_NAME = './extras/SymantecServiceAgreement.txt' 
 		try:
-			with open(AGREEMENT_FILE_NAME, 'r') as agreement_file_obj:
-				SERVICE_AGREEMENT_NOTES = agreement_file_obj.read()
+			SERVICE_AGREEMENT_NOTES = read_service_agreement_notes(config.PortalConfig.AGREEMENT_FILE_NAME)
 		except (IOError, OSError) as agreement_file_err:
 			# Log a comment and abort.
 			csr_uploader_logger.error('EXCEPTION_OCCURED::[AGREEMENT_FILE_ACCESS]::ABORTING::' + str(agreement_file_err))
-			sys.exit(1)
+			# Fails this certificate only, the caller checks the flag.
+			self.failure = True
+			return None
 
-		# Curate the SANs to be included in the request.
-		if config.PortalConfig.SAN_LIST:
-			curated_san_list = '\n'.join(san_list + config.PortalConfig.SAN_LIST)
-		else:
-			curated_san_list = '\n'.join(san_list)
+		# Curate the SANs to be included in the request. These are the very
+		# SANs of the CSR (see `SANEngine.py`).
+		san_set = SANEngine.build_san_set(self.cert_config)
+		curated_san_list = san_set.portal_field()
+		if san_set.duplicates or san_set.covered:
+			csr_uploader_logger.info('SANs dropped: %s duplicated, %s covered by a wildcard.', len(san_set.duplicates), len(san_set.covered))
+		# The *san_list* presently on the portal is only compared against,
+		# the certificate's configuration is what gets submitted. A name
+		# the renewal would silently drop fails the certificate instead.
+		dropped_sans = SANEngine.dropped_sans(SANEngine.SANSet(san_list).names,
+											  san_set.names if self.renewed_sans is None else self.renewed_sans)
+		if dropped_sans:
+			csr_uploader_logger.error('EXCEPTION_OCCURED::[SAN_DROPPED]::ABORTING::SANs of the current certificate not in the renewal: ' + ', '.join(dropped_sans))
+			self.failure = True
+			return None
 
 		# Log a comment.
-		csr_uploader_logger.debug('CURATED_SAN_LIST <FINALIZED> => ' + curated_san_list)
+		csr_uploader_logger.debug('CURATED_SAN_LIST <FINALIZED> => %s', curated_san_list)
 		
 		# This payload should come from a configuration file,
 		# as the data might change from one requester to another.
@@ -197,26 +243,26 @@ class SubmitCSRToPortal(object):
 		# found in the source code hosted at location, 
 		# URI: https://www.symantec.com/scripts/agreement/subscriber_us.js
 		multipart_form_payload = {
-								 'contactInfo.firstName': (None, config.PortalConfig.FIRST_NAME),
-								 'contactInfo.lastName': (None, config.PortalConfig.LAST_NAME),
-								 'contactInfo.email': (None, config.PortalConfig.GROUP_EMAIL),
-								 'contactInfo.additional_field10': (None, config.PortalConfig.SERVER_IP),
-								 'contactInfo.additional_field4': (None, config.PortalConfig.PURPOSE),
-								 'contactInfo.additional_field5': (None, config.PortalConfig.GROUP_MANAGER),
+								 'contactInfo.firstName': (None, self.cert_config.first_name),
+								 'contactInfo.lastName': (None, self.cert_config.last_name),
+								 'contactInfo.email': (None, self.cert_config.group_email),
+								 'contactInfo.additional_field10': (None, self.cert_config.server_ip),
+								 'contactInfo.additional_field4': (None, self.cert_config.purpose),
+								 'contactInfo.additional_field5': (None, self.cert_config.group_manager),
 								 'CheckWeakKey': (None, 'yes'),
-								 'contactInfo.additional_field9': (None, config.PortalConfig.SERVER_CATEGORY),
+								 'contactInfo.additional_field9': (None, self.cert_config.server_category),
 								 'wildcardType': (None, 'N'),
-								 'application': (None, config.PortalConfig.SERVER_APPLICATION_TYPE),
+								 'application': (None, self.cert_config.server_application_type),
 								 'csrChoice': (None, 'text'),
 								 'csrInfo.csrText': (None, csr_content[:-1]),
 								 'csrGeneratedFromApplet': (None, 'N'),
 								 'csrInfo.subjectAltNames': (None, curated_san_list),
-								 'signatureAlgorithm': (None, config.PortalConfig.SIGNATURE_ALGORITHM),
-								 'numLicense': (None, config.PortalConfig.NUMBER_OF_LICENSES),
-								 'validity': (None, config.PortalConfig.CERTIFICATE_VALIDITY),
+								 'signatureAlgorithm': (None, self.cert_config.signature_algorithm),
+								 'numLicense': (None, self.cert_config.number_of_licenses),
+								 'validity': (None, self.cert_config.certificate_validity),
 								 'ctLogOptionChecked': (None, 'true'),
-								 'challenge': (None, config.PortalConfig.CHALLENGE_PHRASE),
-								 'confirmChallenge': (None, config.PortalConfig.CHALLENGE_PHRASE),
+								 'challenge': (None, self.cert_config.challenge_phrase),
+								 'confirmChallenge': (None, self.cert_config.challenge_phrase),
 								 'subAgreementID': (None, 'SSL Certificate Subscriber Agreement Version 10.0 (April 2014)'),
 								 'subAgreementVersion': (None, '10.0'),
 								 'subAgreement': (None, SERVICE_AGREEMENT_NOTES[:-1]),
@@ -239,15 +285,30 @@ class SubmitCSRToPortal(object):
 			csr_uploader_logger.critical('EXCEPTION_OCCURED::[SUBMIT_PAGE]::ABORTING::' + str(request_err))
 			self.failure = True
 
+	def close(self):
+		'''
+		   Release the session's pooled connections. Must be called once the
+		   certificate is done with, a batch would otherwise accumulate one
+		   connection pool per certificate.
+		'''
+		self.cert_renewal_session.close()
+
 if __name__ == '__main__':
+	# Build the certificate configuration from the defaults file and the
+	# environment overrides.
+	try:
+		cert_config = CertificateConfig.build_certificate_config()
+	except CertificateConfig.ConfigValidationError as config_err:
+		csr_uploader_logger.error('EXCEPTION_OCCURED::[CONFIG_VALIDATION]::ABORTING::' + str(config_err))
+		sys.exit(1)
+
 	# Instantiate a CSR Submission Bot.
-	csr_submission_bot = SubmitCSRToPortal()
+	csr_submission_bot = SubmitCSRToPortal(cert_config)
 
 	# Let's get CSR data ready for submission.
 	# We will read it to a variable.
 	# For the sake of testing out the code, I'll be using a DUMMY CSR file.
-	DUMMY_CSR_FILE_NAME = config.CSRConfig.CSR_NAME
-
+	DUMMY_CSR_FILE_NAME = cert_config.csr_name
 	# Use the `with as` context management protocol.
 	# This handles the proper closing of open files and spares us from
 	# doing it manually.
@@ -261,12 +322,12 @@ if __name__ == '__main__':
 
 	# Request the Certificate Details Page.
 	# This is the initial page in the entire flow.
-	csrf_token, details_resp_code = csr_submission_bot.get_cert_details(config.PortalConfig.URL_CERT_DETAILS_PAGE)
+	csrf_token, details_resp_code = csr_submission_bot.get_cert_details(cert_config.url_cert_details_page)
 
 	# Check the response to fetching the Details Page.
 	if details_resp_code == requests.codes.ok and not csr_submission_bot.failure:
 		# Imitate clicking on the Renew Option.
-		renew_url = config.PortalConfig.URL_RENEW_PAGE.format(csrf_token)
+		renew_url = cert_config.url_renew_page(csrf_token)
 		renew_resp_code = csr_submission_bot.select_renew_option(renew_url)
 	else:
 		# Log a comment and abort.
@@ -276,7 +337,7 @@ if __name__ == '__main__':
 	# Check for response to fetching the Renew Option.
 	if renew_resp_code == requests.codes.ok and not csr_submission_bot.failure:
 		# Make a POST request to the enrollment page.
-		enroll_resp_code, san_list = csr_submission_bot.bypass_challenge_phrase(config.PortalConfig.URL_ENROLL_PAGE, csrf_token)
+		enroll_resp_code, san_list = csr_submission_bot.bypass_challenge_phrase(cert_config.url_enroll_page, csrf_token)
 	else:
 		# Log a comment and abort.
 		csr_uploader_logger.error('Failed to Retrieve Renew Page')
@@ -291,7 +352,7 @@ if __name__ == '__main__':
 		csr_uploader_logger.debug('Going Strong: Should Submit CSR now')
 		
 		# Perform the CSR Submit action.
-		csr_submit_resp_code = csr_submission_bot.submit_csr_details(config.PortalConfig.URL_CSR_SUBMIT_PAGE, DUMMY_CSR_CONTENT, csrf_token, san_list)
+		csr_submit_resp_code = csr_submission_bot.submit_csr_details(cert_config.url_csr_submit_page, DUMMY_CSR_CONTENT, csrf_token, san_list)
 	else:
 		# Log a comment and abort.
 		csr_uploader_logger.error('Failed to Retrieve Enrollment Page')
@@ -0,0 +1,365 @@
+#!/usr/bin/env python3
+
+'''
+   This module holds the Post-Deployment Verification sweep. For every
+   renewed certificate of the inventory, a TLS handshake is made with each
+   of its `serving_endpoints`, and the certificate actually served is
+   checked against the `renewed_certificate` (PEM) of the inventory row.
+
+   The endpoint statuses reported are,
+   ******************************************************************
+   * OK          -> The renewed certificate is served, chain valid.  *
+   * CHAIN       -> The renewed certificate is served, but the chain *
+   *                (or the host name) does not verify.              *
+   * OLD_CERT    -> An older issue (same SANs) is still served.      *
+   * MISMATCH    -> Some other certificate is served.                *
+   * UNREACHABLE -> Connection / handshake failed or timed out.      *
+   * CONFIG      -> The renewed certificate could not be loaded.     *
+   ******************************************************************
+
+   The handshakes run concurrently on an asyncio event loop, with a cap
+   on the number in progress and a timeout per endpoint, so that sweeping
+   thousands of endpoints takes minutes. The inventory is streamed.
+'''
+
+##################################################################
+# Module Import Section.
+# Make all the necessary imports within this section.
+# Don't Pollute the entire file, with imports here and there.
+##################################################################
+
+# Used for parsing the command line options.
+import argparse
+# The sweep runs on an event loop.
+import asyncio
+# Used for fingerprinting the certificates.
+import hashlib
+# Logging Module to enable this application to log its events.
+import logging
+# Used for parsing the OpenSSL Tool's output.
+import re
+# TLS handshakes and certificate conversions.
+import ssl
+# Used for the exit status.
+import sys
+# The below import is a time manipulation utility library.
+import time
+
+import CertificateConfig
+import config.VerifyConfig
+
+##################################################################
+
+##################################################################
+# Setting up the logger Instance.
+
+import LoggerUtility
+import config.LoggerConfig
+
+VERIFY_DEPLOYMENT_LOGGER_NAME = '.DeploymentVerifier'
+
+# Instantiate the module level Logger object.
+verify_deployment_logger = logging.getLogger(config.LoggerConfig.APP_LOGGER_NAME + VERIFY_DEPLOYMENT_LOGGER_NAME)
+
+##################################################################
+
+PEM_CERTIFICATE_PATTERN = re.compile(r'-----BEGIN CERTIFICATE-----.+?-----END CERTIFICATE-----', re.DOTALL)
+DNS_SAN_PATTERN         = re.compile(r'DNS:([^,\s]+)')
+
+class CertificateDetails(object):
+	'''
+	   The certificate attributes the sweep compares.
+	'''
+
+	__slots__ = ('fingerprint', 'serial', 'not_after', 'sans',)
+
+	def __init__(self, fingerprint, serial, not_after, sans):
+		self.fingerprint = fingerprint
+		self.serial      = serial
+		self.not_after   = not_after
+		self.sans        = sans
+
+class EndpointResult(object):
+	'''
+	   The verification outcome of a single serving endpoint.
+	'''
+
+	__slots__ = ('app_name', 'endpoint', 'status', 'detail',)
+
+	def __init__(self, app_name, endpoint, status, detail=''):
+		self.app_name = app_name
+		self.endpoint = endpoint
+		self.status   = status
+		self.detail   = detail
+
+def _normalize_serial(serial):
+	return serial.strip().upper().lstrip('0') or '0'
+
+def _fingerprint(der_bytes):
+	return hashlib.sha256(der_bytes).hexdigest()
+
+def split_endpoint(endpoint):
+	'''
+	   Split `host[:port]` (or `[ipv6]:port`) into its host and port.
+	'''
+	if endpoint.startswith('['):
+		host, _, port = endpoint[1:].partition(']')
+		port = port.lstrip(':')
+	elif endpoint.count(':') == 1:
+		host, _, port = endpoint.partition(':')
+	else:
+		host, port = endpoint, ''
+	return host, int(port) if port else config.VerifyConfig.DEFAULT_TLS_PORT
+
+async def describe_certificate(certificate_bytes, certificate_form):
+	'''
+	   Wrapper for calling the OpenSSL Tool, to read the serial, the
+	   expiry and the DNS SANs of a certificate (*certificate_form* being
+	   `PEM` or `DER`).
+	'''
+	proc = await asyncio.create_subprocess_exec('openssl', 'x509', '-inform', certificate_form, '-noout',
+												'-serial', '-enddate', '-ext', 'subjectAltName',
+												stdin=asyncio.subprocess.PIPE,
+												stdout=asyncio.subprocess.PIPE,
+												stderr=asyncio.subprocess.DEVNULL)
+	proc_out = (await proc.communicate(certificate_bytes))[0].decode('utf-8')
+	if proc.returncode:
+		raise ValueError('OpenSSL is unable to read the certificate')
+	serial    = re.search(r'^serial=(\S+)', proc_out, re.MULTILINE)
+	not_after = re.search(r'^notAfter=(.+)$', proc_out, re.MULTILINE)
+	if not serial or not not_after:
+		raise ValueError('OpenSSL output lacks the serial / notAfter')
+	san_section = proc_out.partition('Subject Alternative Name')[2]
+	return (_normalize_serial(serial.group(1)), ssl.cert_time_to_seconds(not_after.group(1).strip()),
+			frozenset(san.lower() for san in DNS_SAN_PATTERN.findall(san_section)))
+
+class ExpectedCertificate(object):
+	'''
+	   The renewed certificate an endpoint should serve. Matching it only
+	   takes the fingerprint; the serial, expiry and SANs are read (once)
+	   when an endpoint serves something else, to tell why.
+	'''
+
+	__slots__ = ('fingerprint', 'der_bytes', '_details',)
+
+	def __init__(self, certificate_file_name):
+		with open(certificate_file_name, 'r') as certificate_file_obj:
+			pem_match = PEM_CERTIFICATE_PATTERN.search(certificate_file_obj.read())
+		if not pem_match:
+			raise ValueError('No PEM certificate found in ' + certificate_file_name)
+		# The first certificate is the leaf, when the file also holds the chain.
+		self.der_bytes   = ssl.PEM_cert_to_DER_cert(pem_match.group(0))
+		self.fingerprint = _fingerprint(self.der_bytes)
+		self._details    = None
+
+	async def details(self):
+		if self._details is None:
+			self._details = asyncio.ensure_future(describe_certificate(self.der_bytes, 'DER'))
+		serial, not_after, sans = await asyncio.shield(self._details)
+		return CertificateDetails(self.fingerprint, serial, not_after, sans)
+
+async def _handshake(host, port, ssl_context, server_hostname, timeout):
+	'''
+	   Connect and complete the TLS handshake. Returns the served leaf
+	   certificate (DER) and, for a verifying context, its decoded form.
+	'''
+	reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port, ssl=ssl_context,
+																	server_hostname=server_hostname),
+											timeout)
+	try:
+		ssl_object = writer.get_extra_info('ssl_object')
+		return ssl_object.getpeercert(binary_form=True), ssl_object.getpeercert()
+	finally:
+		writer.close()
+		if hasattr(writer, 'wait_closed'):
+			try:
+				await asyncio.wait_for(writer.wait_closed(), timeout)
+			except (OSError, ssl.SSLError, asyncio.TimeoutError):
+				pass
+
+def _served_details(der_bytes, peer_certificate):
+	'''
+	   Build the served certificate details out of the verified handshake.
+	'''
+	return CertificateDetails(_fingerprint(der_bytes),
+							  _normalize_serial(peer_certificate['serialNumber']),
+							  ssl.cert_time_to_seconds(peer_certificate['notAfter']),
+							  frozenset(value.lower() for name, value in peer_certificate.get('subjectAltName', ()) if name == 'DNS'))
+
+async def check_endpoint(app_name, server_hostname, endpoint, expected, ssl_contexts, timeout):
+	'''
+	   Verify what a single endpoint serves, against the *expected*
+	   ExpectedCertificate. The *server_hostname* (the certificate's Common
+	   Name) is sent as SNI and verified against the served certificate.
+	   Returns an EndpointResult.
+	'''
+	verify_context, unverified_context = ssl_contexts
+	host, port = split_endpoint(endpoint)
+	chain_problem = None
+	try:
+		try:
+			der_bytes, peer_certificate = await _handshake(host, port, verify_context, server_hostname, timeout)
+		except ssl.SSLError as verify_err:
+			# Verification failed (or the handshake did). Have another go,
+			# without verification, to find out what is being served.
+			chain_problem = getattr(verify_err, 'verify_message', None) or str(verify_err)
+			der_bytes, peer_certificate = await _handshake(host, port, unverified_context, server_hostname, timeout)
+	except (OSError, ssl.SSLError, asyncio.TimeoutError) as connect_err:
+		return EndpointResult(app_name, endpoint, config.VerifyConfig.STATUS_UNREACHABLE,
+							  (chain_problem + '; ' if chain_problem else '') + (str(connect_err) or connect_err.__class__.__name__))
+
+	if _fingerprint(der_bytes) == expected.fingerprint:
+		if chain_problem:
+			return EndpointResult(app_name, endpoint, config.VerifyConfig.STATUS_CHAIN, chain_problem)
+		return EndpointResult(app_name, endpoint, config.VerifyConfig.STATUS_OK)
+
+	if peer_certificate:
+		served = _served_details(der_bytes, peer_certificate)
+	else:
+		try:
+			serial, not_after, sans = await describe_certificate(der_bytes, 'DER')
+		except ValueError as describe_err:
+			return EndpointResult(app_name, endpoint, config.VerifyConfig.STATUS_MISMATCH, str(describe_err))
+		served = CertificateDetails(_fingerprint(der_bytes), serial, not_after, sans)
+
+	try:
+		expected = await expected.details()
+	except ValueError as describe_err:
+		return EndpointResult(app_name, endpoint, config.VerifyConfig.STATUS_CONFIG, str(describe_err))
+
+	differences = []
+	if served.serial != expected.serial:
+		differences.append('serial {} != {}'.format(served.serial, expected.serial))
+	if served.not_after != expected.not_after:
+		differences.append('notAfter {} != {}'.format(time.strftime('%Y-%m-%d', time.gmtime(served.not_after)),
+													  time.strftime('%Y-%m-%d', time.gmtime(expected.not_after))))
+	if served.sans != expected.sans:
+		differences.append('SANs missing: {} / unexpected: {}'.format(sorted(expected.sans - served.sans), sorted(served.sans - expected.sans)))
+	if chain_problem:
+		differences.append('chain: ' + chain_problem)
+	# Only an earlier issue of the same certificate (same SANs) is an old
+	# certificate, anything else expiring earlier is some other one.
+	if served.sans == expected.sans and served.not_after < expected.not_after:
+		status = config.VerifyConfig.STATUS_OLD_CERT
+	else:
+		status = config.VerifyConfig.STATUS_MISMATCH
+	return EndpointResult(app_name, endpoint, status, '; '.join(differences))
+
+class _ExpectedCertificateCache(object):
+	'''
+	   Load each renewed certificate once, share it between the endpoints
+	   of the certificate, and drop it once they are all checked.
+	'''
+
+	def __init__(self):
+		self.entries = {}
+
+	def get(self, cert_config):
+		entry = self.entries.get(cert_config.app_name)
+		if entry is None:
+			entry = [ExpectedCertificate(cert_config.renewed_certificate), len(cert_config.serving_endpoints)]
+			self.entries[cert_config.app_name] = entry
+		entry[1] -= 1
+		if entry[1] <= 0:
+			del self.entries[cert_config.app_name]
+		return entry[0]
+
+def _endpoint_jobs(inventory_rows):
+	'''
+	   Generator yielding `(cert_config, endpoint)` pairs, one per serving
+	   endpoint. Certificates without endpoints have nothing to verify.
+	'''
+	for inventory_row in inventory_rows:
+		try:
+			cert_config = CertificateConfig.build_certificate_config(inventory_row)
+		except CertificateConfig.ConfigValidationError as config_err:
+			yield (None, str(config_err))
+			continue
+		for endpoint in cert_config.serving_endpoints:
+			yield (cert_config, endpoint)
+
+async def _sweep_worker(endpoint_jobs, expected_cache, ssl_contexts, timeout, on_result):
+	# The jobs generator is shared by all the workers. It never awaits,
+	# so the workers cannot step on each other.
+	for cert_config, endpoint in endpoint_jobs:
+		if cert_config is None:
+			on_result(EndpointResult(None, None, config.VerifyConfig.STATUS_CONFIG, endpoint))
+			continue
+		if not cert_config.renewed_certificate:
+			on_result(EndpointResult(cert_config.app_name, endpoint, config.VerifyConfig.STATUS_CONFIG,
+									 'Field `renewed_certificate` is not set'))
+			continue
+		try:
+			expected = expected_cache.get(cert_config)
+		except (IOError, OSError, ValueError) as load_err:
+			on_result(EndpointResult(cert_config.app_name, endpoint, config.VerifyConfig.STATUS_CONFIG, str(load_err)))
+			continue
+		# The `app_name` only names the files, the Common Name is the host.
+		on_result(await check_endpoint(cert_config.app_name, cert_config.common_name, endpoint, expected, ssl_contexts, timeout))
+
+async def _sweep(concurrency, *worker_arguments):
+	await asyncio.gather(*[_sweep_worker(*worker_arguments) for worker_number in range(concurrency)])
+
+def build_ssl_contexts(ca_file=None):
+	'''
+	   The verifying context (chain and host name) and the fallback,
+	   non-verifying, one.
+	'''
+	verify_context = ssl.create_default_context(cafile=ca_file)
+	unverified_context = ssl.create_default_context()
+	unverified_context.check_hostname = False
+	unverified_context.verify_mode = ssl.CERT_NONE
+	return verify_context, unverified_context
+
+def run_verification(inventory_rows, concurrency=None, timeout=None, ca_file=None):
+	'''
+	   Sweep every serving endpoint of the inventory. Each non OK result is
+	   logged as it comes in. Returns the count of endpoints per status and
+	   the list of non OK EndpointResults.
+	'''
+	concurrency = concurrency or config.VerifyConfig.VERIFY_CONCURRENCY
+	timeout     = timeout or config.VerifyConfig.VERIFY_TIMEOUT_SECONDS
+	ca_file     = ca_file or config.VerifyConfig.VERIFY_CA_FILE
+
+	status_counts = {}
+	failures      = []
+
+	def on_result(endpoint_result):
+		status_counts[endpoint_result.status] = status_counts.get(endpoint_result.status, 0) + 1
+		if endpoint_result.status != config.VerifyConfig.STATUS_OK:
+			failures.append(endpoint_result)
+			verify_deployment_logger.error('VERIFY::[%s]::[%s]::%s %s', endpoint_result.app_name,
+										   endpoint_result.endpoint, endpoint_result.status, endpoint_result.detail)
+
+	endpoint_jobs  = _endpoint_jobs(inventory_rows)
+	expected_cache = _ExpectedCertificateCache()
+	ssl_contexts   = build_ssl_contexts(ca_file)
+	event_loop     = asyncio.new_event_loop()
+	# The OpenSSL subprocesses need the loop to be the current one.
+	asyncio.set_event_loop(event_loop)
+	started        = time.time()
+	try:
+		event_loop.run_until_complete(_sweep(concurrency, endpoint_jobs, expected_cache, ssl_contexts, timeout, on_result))
+	finally:
+		asyncio.set_event_loop(None)
+		event_loop.close()
+	verify_deployment_logger.info('Verification sweep of %s endpoint(s) completed in %.1fs: %s', sum(status_counts.values()),
+								  time.time() - started, ', '.join('{}={}'.format(status, count) for status, count in sorted(status_counts.items())))
+	return status_counts, failures
+
+# Execute Module Code.
+if __name__ == '__main__':
+	arg_parser = argparse.ArgumentParser(description='Verify the renewed certificates are being served.')
+	arg_parser.add_argument('--inventory', metavar='CSV_FILE', required=True,
+							help='CSV inventory, with the `serving_endpoints` and `renewed_certificate` fields.')
+	arg_parser.add_argument('--concurrency', type=int, default=config.VerifyConfig.VERIFY_CONCURRENCY,
+							help='Number of handshakes in progress at the same time.')
+	arg_parser.add_argument('--timeout', type=float, default=config.VerifyConfig.VERIFY_TIMEOUT_SECONDS,
+							help='Seconds allowed per endpoint.')
+	arg_parser.add_argument('--ca-file', default=config.VerifyConfig.VERIFY_CA_FILE,
+							help='CA bundle used to verify the served chains (default: system trust store).')
+	args = arg_parser.parse_args()
+
+	status_counts, failures = run_verification(CertificateConfig.read_inventory(args.inventory),
+											   args.concurrency, args.timeout, args.ca_file)
+	sys.exit(1 if failures else 0)
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+
+'''
+   Memory benchmark of the batch path. A synthetic inventory (50k
+   certificates by default) is renewed end to end against the Mock Portal,
+   and the peak RSS of the process is checked against a fixed budget. A
+   batch holding on to its CSRs, responses or parse trees grows with the
+   inventory, and blows the budget long before the 50k-th certificate.
+
+   Run it from the program's home directory,
+        python3 benchmarks/BatchMemoryBenchmark.py [--certificates N]
+   The exit status is non-zero when the budget is exceeded.
+'''
+
+##################################################################
+# Module Import Section.
+##################################################################
+
+import argparse
+import csv
+import logging
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+# The benchmark drives the program's own modules.
+PROGRAM_HOME_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROGRAM_HOME_DIRECTORY)
+
+import RenewCertificate
+import config.LoggerConfig
+
+##################################################################
+
+DEFAULT_CERTIFICATES = 50000
+DEFAULT_WORKERS      = 8
+
+# Peak RSS allowed for the whole run, in MiB. The imports alone (Requests,
+# BeautifulSoup, ...) account for more than half of it, and the peak is
+# about the same for 2k and for 50k certificates.
+PEAK_RSS_BUDGET_MIB = 64
+
+# Any well formed value does, the Mock Portal ignores it.
+BENCHMARK_JUR_HASH = 'F' * 32
+
+# The SANs of the shared CSR, hence of every certificate. The Mock
+# Portal's enrollment page lists the two SANs as already present.
+BENCHMARK_COMMON_NAME = 'bench.example.com'
+BENCHMARK_SAN_LIST    = ('www.example.com', 'api.example.com')
+
+def write_synthetic_inventory(inventory_file_name, certificates, csr_file_name, base_url):
+	'''
+	   Write the inventory row by row, it is never held in memory.
+	'''
+	with open(inventory_file_name, 'w', newline='') as inventory_file_obj:
+		csv_writer = csv.writer(inventory_file_obj)
+		csv_writer.writerow(('app_name', 'common_name', 'issuer_serial', 'jur_hash', 'use_existing_csr', 'base_url', 'san_list'))
+		san_list = ';'.join(BENCHMARK_SAN_LIST)
+		for number in range(certificates):
+			app_name = 'cert{:06d}.bench.example.com'.format(number)
+			csv_writer.writerow((app_name, BENCHMARK_COMMON_NAME, '{:032X}'.format(number), BENCHMARK_JUR_HASH, csr_file_name, base_url,
+								 san_list))
+
+def peak_rss_mib():
+	# Linux reports the value in KiB.
+	return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+if __name__ == '__main__':
+	arg_parser = argparse.ArgumentParser(description='Batch path memory benchmark.')
+	arg_parser.add_argument('--certificates', type=int, default=DEFAULT_CERTIFICATES)
+	arg_parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS)
+	arg_parser.add_argument('--budget-mib', type=float, default=PEAK_RSS_BUDGET_MIB)
+	args = arg_parser.parse_args()
+
+	# Relative paths (i.e, the Service Agreement) are resolved from here.
+	os.chdir(PROGRAM_HOME_DIRECTORY)
+	# Only the problems reach the console, not 10 lines per certificate.
+	logging.getLogger(config.LoggerConfig.APP_LOGGER_NAME).setLevel(logging.WARNING)
+
+	work_directory = tempfile.mkdtemp(prefix='batch_benchmark_')
+	# The Mock Portal runs in its own process, its memory is not ours.
+	mock_portal = subprocess.Popen([sys.executable, os.path.join(PROGRAM_HOME_DIRECTORY, 'benchmarks', 'MockPortal.py')],
+								   stdout=subprocess.PIPE, universal_newlines=True)
+	try:
+		base_url = mock_portal.stdout.readline().strip()
+
+		# A single CSR, shared by all the certificates: the benchmark is
+		# about the batch path, not about OpenSSL key generation.
+		csr_file_name = os.path.join(work_directory, 'bench.csr')
+		subprocess.check_call(['openssl', 'req', '-new', '-newkey', 'rsa:2048', '-nodes',
+							   '-keyout', os.path.join(work_directory, 'bench.key'), '-out', csr_file_name,
+							   '-subj', '/CN=' + BENCHMARK_COMMON_NAME,
+							   '-addext', 'subjectAltName=' + ','.join('DNS:' + name for name in (BENCHMARK_COMMON_NAME,) + BENCHMARK_SAN_LIST)],
+							  stderr=subprocess.DEVNULL)
+		inventory_file_name = os.path.join(work_directory, 'inventory.csv')
+		write_synthetic_inventory(inventory_file_name, args.certificates, csr_file_name, base_url)
+
+		started = time.time()
+		exit_status = RenewCertificate.main(['--inventory', inventory_file_name,
+											 '--workers', str(args.workers),
+											 '--audit-store', os.path.join(work_directory, 'audit.jsonl')])
+		elapsed = time.time() - started
+	finally:
+		mock_portal.terminate()
+		mock_portal.wait()
+		shutil.rmtree(work_directory, ignore_errors=True)
+
+	peak_rss = peak_rss_mib()
+	print('Certificates : {}'.format(args.certificates))
+	print('Workers      : {}'.format(args.workers))
+	print('Elapsed      : {:.1f}s ({:.0f} certificates/minute)'.format(elapsed, args.certificates * 60.0 / elapsed))
+	print('Peak RSS     : {:.1f} MiB (budget: {:.0f} MiB)'.format(peak_rss, args.budget_mib))
+	if exit_status:
+		print('FAILED: the batch reported failures.')
+		sys.exit(1)
+	if peak_rss > args.budget_mib:
+		print('FAILED: peak RSS over budget.')
+		sys.exit(1)
+	print('PASSED')
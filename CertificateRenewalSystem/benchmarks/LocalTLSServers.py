@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+
+'''
+   A fleet of local TLS listeners, standing in for the servers the
+   renewed certificates are deployed to. Every listener completes the
+   handshake with the certificate it was given, and hangs up.
+
+   Run as a program, it listens on 127.0.0.1 and prints, on its first
+   output line, the ports listening with the new certificate, then on the
+   second line the ones still on the old certificate.
+'''
+
+##################################################################
+# Module Import Section.
+##################################################################
+
+import argparse
+import asyncio
+import ssl
+import sys
+
+##################################################################
+
+def _ssl_context(certificate_file_name, key_file_name):
+	ssl_context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+	ssl_context.load_cert_chain(certificate_file_name, key_file_name)
+	return ssl_context
+
+async def _hang_up(reader, writer):
+	writer.close()
+
+async def start_listeners(count, ssl_context):
+	servers = []
+	for number in range(count):
+		servers.append(await asyncio.start_server(_hang_up, '127.0.0.1', 0, ssl=ssl_context, backlog=512))
+	return servers
+
+def _ports(servers):
+	return ' '.join(str(server.sockets[0].getsockname()[1]) for server in servers)
+
+if __name__ == '__main__':
+	arg_parser = argparse.ArgumentParser(description='Local TLS listeners.')
+	arg_parser.add_argument('--key', required=True, help='Private key of both the certificates.')
+	arg_parser.add_argument('--new-certificate', required=True)
+	arg_parser.add_argument('--old-certificate', required=True)
+	arg_parser.add_argument('--new-listeners', type=int, default=50)
+	arg_parser.add_argument('--old-listeners', type=int, default=5)
+	args = arg_parser.parse_args()
+
+	event_loop = asyncio.new_event_loop()
+	new_servers = event_loop.run_until_complete(start_listeners(args.new_listeners, _ssl_context(args.new_certificate, args.key)))
+	old_servers = event_loop.run_until_complete(start_listeners(args.old_listeners, _ssl_context(args.old_certificate, args.key)))
+	print(_ports(new_servers))
+	print(_ports(old_servers))
+	sys.stdout.flush()
+	try:
+		event_loop.run_forever()
+	except KeyboardInterrupt:
+		pass
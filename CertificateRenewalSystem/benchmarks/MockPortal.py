@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+
+'''
+   A local stand-in for the Certificate Authorities' Renewal portal. It
+   serves the four pages walked by the SubmitCSRToPortal Class, with page
+   sizes in the same ballpark as the real ones, so that a batch can be
+   run end to end without ever reaching the CA.
+
+   Run as a program, it listens on 127.0.0.1 and prints the base URL to
+   use for the certificates' `base_url` field, on its first output line.
+'''
+
+##################################################################
+# Module Import Section.
+##################################################################
+
+import argparse
+import http.server
+import socketserver
+import sys
+
+##################################################################
+
+# The portal path, same as the real `BASE_URL`.
+PORTAL_PATH = '/mcelp/enroll/'
+
+# The SubmitCSR module picks the CSRF token from this very slice of the
+# Certificate Details Page.
+CSRF_TOKEN_OFFSET = 1182
+CSRF_TOKEN        = 'f' * 64
+
+# Filler making the pages about as large as the real ones.
+PAGE_PADDING = '<!-- ' + 'x' * 64 * 1024 + ' -->'
+
+DETAILS_PAGE = ('<html>' + ' ' * (CSRF_TOKEN_OFFSET - len('<html>')) + CSRF_TOKEN +
+				'<body>Certificate Details</body>' + PAGE_PADDING + '</html>').encode('utf-8')
+RENEW_PAGE   = ('<html><body>Renew</body>' + PAGE_PADDING + '</html>').encode('utf-8')
+ENROLL_PAGE  = ('<html><body><form>' + '<div><span>field</span></div>' * 100 +
+				'<textarea id="subject_alt_names">www.example.com,api.example.com</textarea>'
+				'</form>' + PAGE_PADDING + '</body></html>').encode('utf-8')
+SUBMIT_PAGE  = b'<html><body>Thank you, your request has been submitted.</body></html>'
+
+class MockPortalRequestHandler(http.server.BaseHTTPRequestHandler):
+
+	# Keep-Alive, as the real portal does.
+	protocol_version = 'HTTP/1.1'
+	# The headers and the body go out in separate writes, do not let the
+	# second one wait on a delayed ACK.
+	disable_nagle_algorithm = True
+
+	def _respond(self, page):
+		self.send_response(200)
+		self.send_header('Content-Type', 'text/html; charset=utf-8')
+		self.send_header('Content-Length', str(len(page)))
+		self.end_headers()
+		self.wfile.write(page)
+
+	def do_GET(self):
+		if self.path.startswith(PORTAL_PATH + 'searchCertDetails'):
+			self._respond(DETAILS_PAGE)
+		elif self.path.startswith(PORTAL_PATH + 'startLcOp'):
+			self._respond(RENEW_PAGE)
+		else:
+			self.send_error(404)
+
+	def do_POST(self):
+		# Drain the request body.
+		self.rfile.read(int(self.headers.get('Content-Length', 0)))
+		if self.path == PORTAL_PATH + 'processChallenge':
+			self._respond(ENROLL_PAGE)
+		elif self.path == PORTAL_PATH + 'enroll':
+			self._respond(SUBMIT_PAGE)
+		else:
+			self.send_error(404)
+
+	def log_message(self, format, *args):
+		# Keep the console quiet.
+		pass
+
+class MockPortalServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+
+	daemon_threads      = True
+	request_queue_size  = 128
+
+if __name__ == '__main__':
+	arg_parser = argparse.ArgumentParser(description='Mock Certificate Authority portal.')
+	arg_parser.add_argument('--port', type=int, default=0, help='Port to listen on (default: any free port).')
+	args = arg_parser.parse_args()
+
+	mock_portal = MockPortalServer(('127.0.0.1', args.port), MockPortalRequestHandler)
+	print('http://127.0.0.1:{}{}'.format(mock_portal.server_address[1], PORTAL_PATH))
+	sys.stdout.flush()
+	try:
+		mock_portal.serve_forever()
+	except KeyboardInterrupt:
+		pass
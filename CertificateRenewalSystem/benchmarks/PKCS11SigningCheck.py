@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+
+'''
+   Check of the PKCS#11 signing backend against a throwaway SoftHSM token.
+   A token is initialized in a temporary directory, a CSR is signed within
+   it for a certificate with SANs, and the CSR must verify with
+   `openssl req -verify` and hold the very SANs of the certificate.
+
+   Run it from the program's home directory,
+        python3 benchmarks/PKCS11SigningCheck.py [--module /usr/lib/softhsm/libsofthsm2.so]
+   The check is skipped (exit status zero) when SoftHSM or the PKCS#11
+   modules are not installed. The exit status is non-zero when the CSR
+   does not verify or its SANs differ.
+'''
+
+##################################################################
+# Module Import Section.
+##################################################################
+
+import argparse
+import logging
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+
+# The benchmark drives the program's own modules.
+PROGRAM_HOME_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROGRAM_HOME_DIRECTORY)
+
+import CertificateConfig
+import SANEngine
+import SigningBackend
+import config.LoggerConfig
+import config.SigningConfig
+
+##################################################################
+
+CHECK_TOKEN_LABEL = 'CertRenewalCheck'
+CHECK_USER_PIN    = '1234'
+CHECK_SO_PIN      = '123456'
+
+def skip(reason):
+	print('SKIPPED: ' + reason)
+	sys.exit(0)
+
+def init_token(work_directory):
+	'''
+	   Initialize a SoftHSM token of its own, kept in *work_directory*.
+	'''
+	token_directory = os.path.join(work_directory, 'tokens')
+	os.makedirs(token_directory)
+	softhsm_conf = os.path.join(work_directory, 'softhsm2.conf')
+	with open(softhsm_conf, 'w') as softhsm_conf_obj:
+		softhsm_conf_obj.write('directories.tokendir = {}\nobjectstore.backend = file\n'.format(token_directory))
+	# The module reads it when loaded, i.e, by the backend below.
+	os.environ['SOFTHSM2_CONF'] = softhsm_conf
+	subprocess.check_call(['softhsm2-util', '--init-token', '--free', '--label', CHECK_TOKEN_LABEL,
+						   '--pin', CHECK_USER_PIN, '--so-pin', CHECK_SO_PIN], stdout=subprocess.DEVNULL)
+
+def csr_problems(csr_file_name, expected_sans):
+	'''
+	   What is wrong with the CSR: a signature which does not verify, or
+	   SANs other than *expected_sans*.
+	'''
+	verify_proc = subprocess.run(['openssl', 'req', '-verify', '-noout', '-in', csr_file_name],
+								 stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True)
+	if verify_proc.returncode:
+		return ['signature does not verify: ' + verify_proc.stdout.strip()]
+	csr_text = subprocess.check_output(['openssl', 'req', '-noout', '-text', '-in', csr_file_name], universal_newlines=True)
+	csr_sans = re.findall(r'DNS:([^,\s]+)', csr_text)
+	if csr_sans != list(expected_sans):
+		return ['SANs {} != {}'.format(csr_sans, list(expected_sans))]
+	return []
+
+if __name__ == '__main__':
+	arg_parser = argparse.ArgumentParser(description='PKCS#11 signing backend check, against SoftHSM.')
+	arg_parser.add_argument('--module', default=config.SigningConfig.PKCS11_MODULE)
+	args = arg_parser.parse_args()
+
+	if SigningBackend.pkcs11 is None:
+		skip('the `python-pkcs11` and `asn1crypto` modules are not installed.')
+	if not os.path.isfile(args.module):
+		skip('PKCS#11 module not found: ' + args.module)
+	if shutil.which('softhsm2-util') is None:
+		skip('`softhsm2-util` not found.')
+
+	# Only the problems reach the console.
+	logging.getLogger(config.LoggerConfig.APP_LOGGER_NAME).setLevel(logging.WARNING)
+
+	work_directory = tempfile.mkdtemp(prefix='pkcs11_check_')
+	signing_backend = None
+	try:
+		init_token(work_directory)
+		signing_backend = SigningBackend.PKCS11SigningBackend(args.module, CHECK_TOKEN_LABEL, CHECK_USER_PIN)
+		# The portal identifiers are never used, any well formed value does.
+		cert_config = CertificateConfig.build_certificate_config({'app_name': 'check.example.com',
+																  'issuer_serial': '0' * 32,
+																  'jur_hash': 'F' * 32,
+																  'san_list': 'www.example.com;API.example.com.;*.apps.example.com',
+																  'signing_backend': config.SigningConfig.SIGNING_BACKEND_PKCS11})
+		csr_file_name = os.path.join(work_directory, 'check.csr')
+		with open(csr_file_name, 'w') as csr_file_obj:
+			csr_file_obj.write(signing_backend.generate_csr(cert_config))
+		# A second CSR, with the key pair now present in the token.
+		with open(csr_file_name, 'w') as csr_file_obj:
+			csr_file_obj.write(signing_backend.generate_csr(cert_config))
+		problems = csr_problems(csr_file_name, SANEngine.build_san_set(cert_config).names)
+	except (subprocess.CalledProcessError, SigningBackend.SigningBackendError) as check_err:
+		problems = [str(check_err)]
+	finally:
+		if signing_backend:
+			signing_backend.close()
+		shutil.rmtree(work_directory, ignore_errors=True)
+
+	if problems:
+		print('FAILED: ' + '; '.join(problems))
+		sys.exit(1)
+	print('PASSED')
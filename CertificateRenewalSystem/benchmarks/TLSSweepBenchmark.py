@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+
+'''
+   Benchmark of the Post-Deployment Verification sweep. A local CA issues
+   an old and a renewed `*.sweep.example.com` certificate, a fleet of local
+   TLS listeners serves them (most of them the renewed one), and a
+   synthetic inventory spreads its endpoints over the listeners plus one
+   closed port. Every other certificate has an `app_name` which is not a
+   host name, its Common Name is the host the sweep must connect to. The
+   sweep must flag exactly the stale and the unreachable endpoints, and
+   the handshake rate is reported.
+
+   Run it from the program's home directory,
+        python3 benchmarks/TLSSweepBenchmark.py [--certificates N] [--endpoints-per-certificate M]
+   The exit status is non-zero when the sweep misreports an endpoint.
+'''
+
+##################################################################
+# Module Import Section.
+##################################################################
+
+import argparse
+import csv
+import logging
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+# The benchmark drives the program's own modules.
+PROGRAM_HOME_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROGRAM_HOME_DIRECTORY)
+
+import CertificateConfig
+import VerifyDeployment
+import config.LoggerConfig
+import config.VerifyConfig
+
+##################################################################
+
+DEFAULT_CERTIFICATES              = 2000
+DEFAULT_ENDPOINTS_PER_CERTIFICATE = 5
+NEW_LISTENERS                     = 50
+OLD_LISTENERS                     = 5
+
+def _openssl(*arguments):
+	subprocess.check_call(('openssl',) + arguments, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+def issue_certificates(work_directory):
+	'''
+	   A CA, and an old and a renewed leaf sharing the same key.
+	'''
+	paths = dict((name, os.path.join(work_directory, file_name)) for name, file_name in (
+		('ca_key', 'ca.key'), ('ca', 'ca.pem'), ('key', 'leaf.key'), ('csr', 'leaf.csr'),
+		('extensions', 'leaf.cnf'), ('old', 'old.pem'), ('new', 'new.pem')))
+	_openssl('req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-keyout', paths['ca_key'], '-out', paths['ca'],
+			 '-days', '30', '-subj', '/CN=Sweep Benchmark CA')
+	_openssl('req', '-new', '-newkey', 'rsa:2048', '-nodes', '-keyout', paths['key'], '-out', paths['csr'],
+			 '-subj', '/CN=*.sweep.example.com')
+	with open(paths['extensions'], 'w') as extensions_file_obj:
+		extensions_file_obj.write('subjectAltName=DNS:*.sweep.example.com\n')
+	for name, days in (('old', '10'), ('new', '20')):
+		_openssl('x509', '-req', '-in', paths['csr'], '-CA', paths['ca'], '-CAkey', paths['ca_key'],
+				 '-CAcreateserial', '-days', days, '-extfile', paths['extensions'], '-out', paths[name])
+	return paths
+
+def closed_port():
+	# A port nothing listens on, once the socket is closed.
+	probe_socket = socket.socket()
+	probe_socket.bind(('127.0.0.1', 0))
+	port = probe_socket.getsockname()[1]
+	probe_socket.close()
+	return port
+
+def write_synthetic_inventory(inventory_file_name, certificates, endpoints_per_certificate, ports, renewed_certificate):
+	'''
+	   Round robin the endpoints over *ports*. Returns the number of
+	   endpoints that landed on each port.
+	'''
+	port_hits = dict((port, 0) for port in ports)
+	endpoint_number = 0
+	with open(inventory_file_name, 'w', newline='') as inventory_file_obj:
+		csv_writer = csv.writer(inventory_file_obj)
+		csv_writer.writerow(('app_name', 'common_name', 'issuer_serial', 'jur_hash', 'serving_endpoints', 'renewed_certificate'))
+		for number in range(certificates):
+			endpoints = []
+			for _ in range(endpoints_per_certificate):
+				port = ports[endpoint_number % len(ports)]
+				port_hits[port] += 1
+				endpoints.append('127.0.0.1:{}'.format(port))
+				endpoint_number += 1
+			common_name = 'cert{:06d}.sweep.example.com'.format(number)
+			# The `app_name` is only a file naming key, not always a host name.
+			app_name = common_name if number % 2 == 0 else 'webapp-{:06d}'.format(number)
+			csv_writer.writerow((app_name, common_name, '{:032X}'.format(number), 'F' * 32,
+								 CertificateConfig.LIST_FIELD_SEPERATOR.join(endpoints), renewed_certificate))
+	return port_hits
+
+if __name__ == '__main__':
+	arg_parser = argparse.ArgumentParser(description='Post-Deployment Verification sweep benchmark.')
+	arg_parser.add_argument('--certificates', type=int, default=DEFAULT_CERTIFICATES)
+	arg_parser.add_argument('--endpoints-per-certificate', type=int, default=DEFAULT_ENDPOINTS_PER_CERTIFICATE)
+	arg_parser.add_argument('--concurrency', type=int, default=config.VerifyConfig.VERIFY_CONCURRENCY)
+	args = arg_parser.parse_args()
+
+	# Every stale endpoint is logged, keep them off the console.
+	logging.getLogger(config.LoggerConfig.APP_LOGGER_NAME).setLevel(logging.CRITICAL)
+
+	work_directory = tempfile.mkdtemp(prefix='sweep_benchmark_')
+	local_servers = None
+	try:
+		paths = issue_certificates(work_directory)
+		# The listeners run in their own process, the sweep has the event
+		# loop to itself.
+		local_servers = subprocess.Popen([sys.executable, os.path.join(PROGRAM_HOME_DIRECTORY, 'benchmarks', 'LocalTLSServers.py'),
+										  '--key', paths['key'], '--new-certificate', paths['new'], '--old-certificate', paths['old'],
+										  '--new-listeners', str(NEW_LISTENERS), '--old-listeners', str(OLD_LISTENERS)],
+										 stdout=subprocess.PIPE, universal_newlines=True)
+		new_ports = [int(port) for port in local_servers.stdout.readline().split()]
+		old_ports = [int(port) for port in local_servers.stdout.readline().split()]
+		unreachable_port = closed_port()
+
+		inventory_file_name = os.path.join(work_directory, 'inventory.csv')
+		port_hits = write_synthetic_inventory(inventory_file_name, args.certificates, args.endpoints_per_certificate,
+											  new_ports + old_ports + [unreachable_port], paths['new'])
+		expected_counts = {
+			config.VerifyConfig.STATUS_OK:          sum(port_hits[port] for port in new_ports),
+			config.VerifyConfig.STATUS_OLD_CERT:    sum(port_hits[port] for port in old_ports),
+			config.VerifyConfig.STATUS_UNREACHABLE: port_hits[unreachable_port],
+		}
+
+		started = time.time()
+		status_counts, failures = VerifyDeployment.run_verification(CertificateConfig.read_inventory(inventory_file_name),
+																	concurrency=args.concurrency, ca_file=paths['ca'])
+		elapsed = time.time() - started
+	finally:
+		if local_servers:
+			local_servers.terminate()
+			local_servers.wait()
+		shutil.rmtree(work_directory, ignore_errors=True)
+
+	endpoints = sum(status_counts.values())
+	print('Certificates : {}'.format(args.certificates))
+	print('Endpoints    : {}'.format(endpoints))
+	print('Concurrency  : {}'.format(args.concurrency))
+	print('Elapsed      : {:.1f}s ({:.0f} handshakes/second)'.format(elapsed, endpoints / elapsed))
+	print('Statuses     : {}'.format(', '.join('{}={}'.format(status, count) for status, count in sorted(status_counts.items()))))
+	if status_counts != dict((status, count) for status, count in expected_counts.items() if count):
+		print('FAILED: expected {}'.format(', '.join('{}={}'.format(status, count) for status, count in sorted(expected_counts.items()))))
+		sys.exit(1)
+	print('PASSED')
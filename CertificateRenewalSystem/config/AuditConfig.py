@@ -0,0 +1,39 @@
+# Configuration Options for the Renewal Audit Trail.
+# Every run and every certificate processed within it is recorded into
+# the below (append-only) store, one JSON record per line. Unlike the
+# log file, the store is never clobbered.
+
+# The Audit Store location.
+AUDIT_STORE_LOCATION = 'audit_store/'
+AUDIT_STORE_FILENAME = AUDIT_STORE_LOCATION + 'RenewalAudit.jsonl'
+
+# The stages of a certificate renewal, in the order they are run.
+# The portal stages are named after the log tags of the SubmitCSR module.
+STAGE_CSR_GENERATION = 'CSR_GENERATION'
+STAGE_DETAILS_PAGE   = 'DETAILS_PAGE'
+STAGE_RENEW_PAGE     = 'RENEW_PAGE'
+STAGE_ENROLL_PAGE    = 'ENROLL_PAGE'
+STAGE_SUBMIT_PAGE    = 'SUBMIT_PAGE'
+STAGES = (STAGE_CSR_GENERATION, STAGE_DETAILS_PAGE, STAGE_RENEW_PAGE,
+          STAGE_ENROLL_PAGE, STAGE_SUBMIT_PAGE)
+
+# Recorded as the failed stage of a certificate whose configuration (or
+# SAN partitioning) is invalid. Nothing is run, hence not a timed stage.
+STAGE_CONFIG = 'CONFIG'
+# Recorded as the failed stage of a certificate failing the Pre-Flight
+# check, which aborts the whole batch.
+STAGE_PRE_FLIGHT = 'PRE_FLIGHT'
+
+# Outcome values.
+OUTCOME_SUCCESS = 'success'
+OUTCOME_FAILURE = 'failure'
+
+# Outcome values of a run.
+RUN_OUTCOME_COMPLETED         = 'completed'
+RUN_OUTCOME_PRE_FLIGHT_FAILED = 'pre_flight_failed'
+
+# Number of entries listed in the *slowest stages* section of a report.
+REPORT_TOP_N = 10
+
+# Report output formats.
+REPORT_FORMATS = ('json', 'csv', 'html')
@@ -4,7 +4,7 @@
 # requirements.
 
 # Import the CSRConfig module for accessing the APP_NAME entry.
-import CSRConfig
+from config import CSRConfig
 
 BASE_URL = 'https://certmanager.websecurity.symantec.com/mcelp/enroll/'
 
@@ -17,6 +17,7 @@ REQUEST_METHOD = {'GET': 0, 'POST': 1}
 
 # The below option uniquely identifies the Certificate in question.
 # The value varies per certificate.
+# The `X`s are a placeholder, a certificate must set its own value.
 ISSUER_SERIAL = 'XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX'
 
 # Submission Form Entities.
@@ -24,7 +25,8 @@ FIRST_NAME              = 'Dipankar'
 LAST_NAME               = 'Achinta'
 GROUP_EMAIL             = 'it@example.com'
 SERVER_IP               = ''
-PURPOSE                 = 'Certificate Renewal for ' + CSRConfig.APP_NAME
+PURPOSE_TEMPLATE        = 'Certificate Renewal for {}'
+PURPOSE                 = PURPOSE_TEMPLATE.format(CSRConfig.APP_NAME)
 GROUP_MANAGER           = 'MANAGER_NAME'
 
 #!!!!!!!!!!!!!!!!!!!!!!! CAUTION !!!!!!!!!!!!!!!!!!!!!!!!!!!!!
@@ -45,6 +47,8 @@ CERTIFICATE_VALIDITY = '2'
 CHALLENGE_PHRASE     = 'FastFerr@ri1'
 
 # List out the SANs required while raising the request.
+# Every SAN already on the portal must be listed (or covered by a listed
+# wildcard), the certificate fails at submission otherwise.
 # Structure: ['san_string_1', 'san_string_2', ...]
 SAN_LIST = []
 
@@ -52,22 +56,36 @@ SAN_LIST = []
 
 # This value is a constant within the organization's certificates.
 # This value binds the certificate to the Organization's Certificate Domain.
+# The `X`s are a placeholder, replace them with the real value.
 JUR_HASH = 'XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX'
 
+# The issuer serial(s) and the jurisdiction hash are hexadecimal strings
+# of the below length.
+ISSUER_SERIAL_LENGTH = 32
+JUR_HASH_LENGTH      = 32
+
+# The Service Agreement Notes, submitted along with the CSR.
+# The location is relative to the program's home directory.
+AGREEMENT_FILE_NAME = './extras/SymantecServiceAgreement.txt'
+
+# The URLs below are templates. They are filled in per certificate
+# by the CertificateConfig object (see `CertificateConfig.py`).
+
+# The `BASE_URL` above is the default `{base_url}` of a certificate.
+
 # URL METHOD - GET
-URL_CERT_DETAILS_PAGE = BASE_URL + \
-                        'searchCertDetails?issuerSerial=' + \
-                        ISSUER_SERIAL + \
-                        '&jur_hash=' + JUR_HASH
+URL_CERT_DETAILS_PAGE = '{base_url}' + \
+                        'searchCertDetails?issuerSerial={issuer_serial}' + \
+                        '&jur_hash={jur_hash}'
 
 # URL METHOD - GET
-URL_RENEW_PAGE = BASE_URL + 'startLcOp?issuerSerial=' + \
-                 ISSUER_SERIAL + '&opCode=renew&csrfToken={0}&csrfToken={0}'
+URL_RENEW_PAGE = '{base_url}' + 'startLcOp?issuerSerial={issuer_serial}' + \
+                 '&opCode=renew&csrfToken={csrf_token}&csrfToken={csrf_token}'
 
 # URL METHOD - POST
 # The below content-type is posted to the server.
 # ::> Content-Type -> application/x-www-form-urlencoded
-URL_ENROLL_PAGE = BASE_URL + 'processChallenge'
+URL_ENROLL_PAGE = '{base_url}' + 'processChallenge'
 
 # URL METHOD - POST
-URL_CSR_SUBMIT_PAGE = BASE_URL + 'enroll'
+URL_CSR_SUBMIT_PAGE = '{base_url}' + 'enroll'
@@ -0,0 +1,24 @@
+# Configuration Options for the Profiling mode (`--profile`).
+# While profiling, the stacks of the threads busy with a renewal stage
+# are sampled at a fixed interval, and aggregated per stage for the run.
+
+# Where the profiles are written, one directory per run.
+PROFILE_OUTPUT_LOCATION = 'profiles/'
+
+# Time between two samples. Waits (network, OpenSSL subprocess) are
+# sampled as well, the profile is of the wall clock time.
+SAMPLE_INTERVAL_SECONDS = 0.005
+
+# Frames kept per sample, counted from the innermost one.
+MAX_STACK_DEPTH = 128
+
+# Number of functions listed per stage in the hotspots table.
+PROFILE_TOP_N = 15
+
+# Output files, within the run's directory.
+# The collapsed stacks (one `frame;frame;... count` line per distinct
+# stack) are ready for `flamegraph.pl` / speedscope, the stage being the
+# root frame.
+COLLAPSED_STACKS_FILENAME = 'stages.collapsed'
+STAGE_COLLAPSED_FILENAME  = '{stage}.collapsed'
+HOTSPOTS_FILENAME         = 'hotspots.txt'
@@ -0,0 +1,17 @@
+# Configuration Options for the Subject Alternative Names (SAN) engine.
+# The SANs of a certificate (its Common Name first, then `san_list`) are
+# normalized and deduplicated once, and the very same list goes into the
+# CSR's SAN extension and into the portal's SAN form field.
+
+# The CA's limit of SANs per certificate, the Common Name included.
+# A larger set is split over several certificates, see below.
+MAX_SANS_PER_CERTIFICATE = 250
+
+# Seperator of the SANs within the portal's form field.
+PORTAL_SAN_SEPERATOR = '\n'
+
+# Name of the additional certificates, when the SANs of a certificate
+# have to be split. The first part keeps the certificate's own name. Each
+# additional part renews the certificate listed, in order, within the
+# certificate's `part_issuer_serials` field.
+PART_APP_NAME_TEMPLATE = '{app_name}.part{part_number}'
@@ -0,0 +1,37 @@
+# The configuration file for the CSR signing backend(s).
+# Please change the below settings, to suit your need.
+
+# The signing backend used by default, when the certificate's inventory
+# row (or the environment) does not say otherwise.
+# Valid Options,
+# *****************************************************************
+# * software -> OpenSSL generates the Private Key into the PKEY   *
+# *             store and signs the CSR (the original behaviour). *
+# * pkcs11   -> The Private Key is generated and kept inside a    *
+# *             PKCS#11 token (HSM), which also signs the CSR.    *
+# *****************************************************************
+SIGNING_BACKEND_SOFTWARE = 'software'
+SIGNING_BACKEND_PKCS11   = 'pkcs11'
+SIGNING_BACKENDS         = (SIGNING_BACKEND_SOFTWARE, SIGNING_BACKEND_PKCS11)
+SIGNING_BACKEND          = SIGNING_BACKEND_SOFTWARE
+
+#********************** VARIABLE SECTION ************************
+
+# The PKCS#11 module (shared library) of the token.
+# The default points to SoftHSM, which can be used to try things out
+# locally (see the README).
+PKCS11_MODULE      = '/usr/lib/softhsm/libsofthsm2.so'
+PKCS11_TOKEN_LABEL = 'CertRenewal'
+
+# The User PIN is never kept in a file. It is read from the below
+# Environment Variable at the time the token is opened.
+PKCS11_USER_PIN_ENV = 'CERT_RENEWAL_PKCS11_PIN'
+
+# Number of token sessions kept open (and logged in) for the whole run.
+# Each concurrent signing operation holds one session.
+PKCS11_SESSION_POOL_SIZE = 4
+
+# The key pair generated within the token.
+PKCS11_RSA_KEY_SIZE = 2048
+
+#********************** VARIABLE SECTION ************************
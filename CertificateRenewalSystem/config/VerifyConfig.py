@@ -0,0 +1,24 @@
+# Configuration Options for the Post-Deployment Verification sweep.
+# The sweep connects to every serving endpoint of the renewed
+# certificates and checks what is actually being served.
+
+# Port used for the endpoints listed without one.
+DEFAULT_TLS_PORT = 443
+
+# Number of TLS handshakes in progress at the same time.
+VERIFY_CONCURRENCY = 200
+
+# Time allowed for connecting and completing the handshake, per endpoint.
+VERIFY_TIMEOUT_SECONDS = 5
+
+# CA bundle used to verify the served chain. `None` means the system's
+# default trust store.
+VERIFY_CA_FILE = None
+
+# Endpoint statuses.
+STATUS_OK          = 'OK'
+STATUS_OLD_CERT    = 'OLD_CERT'
+STATUS_MISMATCH    = 'MISMATCH'
+STATUS_CHAIN       = 'CHAIN'
+STATUS_UNREACHABLE = 'UNREACHABLE'
+STATUS_CONFIG      = 'CONFIG'